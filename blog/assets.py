@@ -0,0 +1,77 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+from blog.storage import compressors
+
+FAR_FUTURE = 365 * 24 * 60 * 60
+# Unhashed names may change content at the next deployment.
+SHORT_LIVED = 5 * 60
+ENCODINGS = {'.br': 'br', '.gz': 'gzip'}
+ASSET_URL = re.compile(r'(?:href|src)="(%s[^"]+)"'
+                       % re.escape(settings.STATIC_URL))
+
+
+def is_hashed(name):
+    return name in getattr(staticfiles_storage, 'hashed_files', {}).values()
+
+
+def accepted_encodings(request):
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    return set(part.split(';')[0].strip() for part in header.split(','))
+
+
+def serve_static(request, path):
+    """
+    Serves a collected static file, picking its precompressed sibling when
+    the client accepts that encoding. Hashed names never change content,
+    so they are cached for a year.
+    """
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except (SuspiciousFileOperation, ValueError):
+        raise Http404('Invalid static path')
+    if not os.path.isfile(fullpath):
+        raise Http404('No such static file')
+    stat = os.stat(fullpath)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                              stat.st_mtime, stat.st_size):
+        return HttpResponseNotModified()
+    content_type = mimetypes.guess_type(fullpath)[0] or \
+        'application/octet-stream'
+    served, encoding = fullpath, None
+    accepted = accepted_encodings(request)
+    for suffix, _ in compressors():
+        if ENCODINGS[suffix] in accepted and \
+                os.path.isfile(fullpath + suffix):
+            served, encoding = fullpath + suffix, ENCODINGS[suffix]
+            break
+    response = FileResponse(open(served, 'rb'), content_type=content_type)
+    response['Content-Length'] = os.path.getsize(served)
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if is_hashed(path):
+        response['Cache-Control'] = 'public, max-age=%d, immutable' \
+            % FAR_FUTURE
+    else:
+        response['Cache-Control'] = 'public, max-age=%d' % SHORT_LIVED
+    return response
+
+
+def page_assets(html):
+    """Static file names a rendered page references."""
+    names = []
+    for url in ASSET_URL.findall(html):
+        name = url[len(settings.STATIC_URL):].split('?')[0].split('#')[0]
+        if name not in names:
+            names.append(name)
+    return names
@@ -0,0 +1,74 @@
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from blog.models import CustomImage, avatar_name
+
+
+def _makedirs(path):
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+
+def _stream_to_temp(upload):
+    directory = default_storage.path(os.path.join(settings.AVATAR_DIR, 'tmp'))
+    _makedirs(directory)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        for chunk in upload.chunks():
+            digest.update(chunk)
+            f.write(chunk)
+    return tmp_path, digest.hexdigest()
+
+
+def store_avatar(upload):
+    """
+    Returns the CustomImage holding the uploaded content. The upload is
+    streamed to disk chunk by chunk while it is hashed, and a new image is
+    only stored when no image with the same content exists yet.
+    """
+    tmp_path, digest = _stream_to_temp(upload)
+    try:
+        image = CustomImage.objects.filter(sha256=digest).first()
+        if image is not None:
+            return image
+        name = avatar_name(digest, os.path.splitext(upload.name)[1].lower())
+        path = default_storage.path(name)
+        _makedirs(os.path.dirname(path))
+        os.rename(tmp_path, path)
+        try:
+            with transaction.atomic():
+                image = CustomImage.objects.create(img=name, sha256=digest)
+        except IntegrityError:
+            return CustomImage.objects.get(sha256=digest)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    from blog.tasks import make_avatar_thumbnail
+    make_avatar_thumbnail.delay(image.pk)
+    return image
+
+
+def make_thumbnail(image):
+    if image.thumbnail:
+        return image.thumbnail.name
+    from PIL import Image
+    size = getattr(settings, 'AVATAR_THUMBNAIL_SIZE', 64)
+    with default_storage.open(image.img.name, 'rb') as f:
+        picture = Image.open(f)
+        picture.thumbnail((size, size))
+        if picture.mode not in ('RGB', 'RGBA'):
+            picture = picture.convert('RGBA')
+        content = BytesIO()
+        picture.save(content, 'PNG')
+    name = '%s_%d.png' % (image.sha256 or image.pk, size)
+    image.thumbnail.save(name, ContentFile(content.getvalue()), save=False)
+    CustomImage.objects.filter(pk=image.pk)\
+        .update(thumbnail=image.thumbnail.name)
+    return image.thumbnail.name
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+
+class LocMemBackend(object):
+    """In-process LRU storage."""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return None
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class FileBackend(object):
+    """
+    Storage shared by the processes of a host, one pickled file per key.
+    Reads refresh the file mtime, so culling the oldest files evicts the
+    least recently used entries.
+    """
+
+    def __init__(self, location, max_entries=1000):
+        self.location = location
+        self.max_entries = max_entries
+        if not os.path.exists(location):
+            os.makedirs(location)
+
+    def _path(self, key):
+        name = hashlib.md5(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.location, name + '.cache')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return value
+
+    def set(self, key, value):
+        fd, tmp_path = tempfile.mkstemp(dir=self.location)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, self._path(key))
+        self._cull()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.location):
+            self._remove(name)
+
+    def _remove(self, name):
+        try:
+            os.remove(os.path.join(self.location, name))
+        except OSError:
+            pass
+
+    def _cull(self):
+        names = [name for name in os.listdir(self.location)
+                 if name.endswith('.cache')]
+        if len(names) <= self.max_entries:
+            return
+        names.sort(key=lambda name: os.path.getmtime(
+            os.path.join(self.location, name)))
+        for name in names[:len(names) - self.max_entries]:
+            self._remove(name)
+
+
+class ArticleCache(object):
+    """
+    Rendered article bodies keyed by slug. An entry is only served while
+    the ``updated`` stamp it was rendered from matches the article.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls):
+        config = getattr(settings, 'BLOG_ARTICLE_CACHE', {})
+        backend = import_string(config.get('BACKEND',
+                                           'blog.cache.LocMemBackend'))
+        return cls(backend(**config.get('OPTIONS', {})))
+
+    def get(self, article):
+        entry = self.backend.get(article.slug)
+        if entry is not None and entry[0] == article.updated:
+            self.hits += 1
+            return mark_safe(entry[1])
+        self.misses += 1
+        return None
+
+    def set(self, article, body):
+        self.backend.set(article.slug, (article.updated, body))
+
+    def invalidate(self, slug):
+        self.backend.delete(slug)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+article_cache = SimpleLazyObject(ArticleCache.from_settings)
@@ -0,0 +1,52 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import F
+from blog.models import ArticleComment
+from blog.pagination import KeysetPaginator
+
+CommentThread = namedtuple('CommentThread', ['count', 'top', 'page'])
+
+
+def get_top_size():
+    return getattr(settings, 'BLOG_COMMENTS_TOP', 5)
+
+
+def comments_of(article):
+    return ArticleComment.objects.filter(article_id=article.pk)\
+        .select_related('author__user')
+
+
+def comment_thread(article, before=None, after=None, top=None):
+    """
+    Returns the ``top`` best ranked comments of the article, shown on the
+    first page only, and a keyset page, newest first, of the others.
+    Authors come with their comments, so the thread is two queries.
+    """
+    top = get_top_size() if top is None else top
+    ranked = comments_of(article).order_by('-ranking', '-pk')[:top]
+    if before or after:
+        top_pks, ranked = list(ranked.values_list('pk', flat=True)), []
+    else:
+        ranked = list(ranked) if top else []
+        top_pks = [comment.pk for comment in ranked]
+    page = KeysetPaginator(comments_of(article).exclude(pk__in=top_pks),
+                           'created').page(before=before, after=after)
+    return CommentThread(article.comment_count, ranked, page)
+
+
+def vote(comment_pk, delta):
+    """
+    Adds ``delta`` to the ranking in a single UPDATE, so concurrent votes
+    never read and write back a stale value. Returns the new ranking.
+    """
+    ArticleComment.objects.filter(pk=comment_pk)\
+        .update(ranking=F('ranking') + delta)
+    return ArticleComment.objects.filter(pk=comment_pk)\
+        .values_list('ranking', flat=True).first()
+
+
+def comment_as_dict(comment):
+    return {'pk': comment.pk, 'author': comment.author.user.get_username(),
+            'content': comment.content, 'ranking': comment.ranking,
+            'created': comment.created.isoformat()}
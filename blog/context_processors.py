@@ -0,0 +1,19 @@
+from blog.models import CustomUser
+
+
+def unread_count(request):
+    """
+    Exposes the unread counter of the current user. It is resolved lazily,
+    from request.profile when ProfileMiddleware set it, so templates that
+    don't show it cost nothing.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated():
+        return {}
+
+    def count():
+        if hasattr(request, 'profile'):
+            return getattr(request.profile, 'unread_count', 0)
+        return CustomUser.objects.filter(user=user)\
+            .values_list('unread_count', flat=True).first() or 0
+    return {'unread_count': count}
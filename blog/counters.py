@@ -0,0 +1,30 @@
+from collections import defaultdict
+
+from django.db.models import F
+from django.db.models.functions import Greatest
+from blog.models import CustomUser
+
+
+def counted(rows):
+    """
+    The rows of an ArticleList queryset the unread counters count: unread
+    rows of published articles.
+    """
+    return rows.filter(read=False, article__published=True)
+
+
+def add_unread(deltas):
+    """
+    Applies {CustomUser pk: delta} to the unread counters, one UPDATE per
+    distinct delta. Counters never go below zero.
+    """
+    by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(pk)
+    for delta, pks in by_delta.items():
+        if delta > 0:
+            value = F('unread_count') + delta
+        else:
+            value = Greatest(F('unread_count') - (-delta), 0)
+        CustomUser.objects.filter(pk__in=pks).update(unread_count=value)
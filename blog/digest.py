@@ -0,0 +1,107 @@
+import operator
+import time
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from functools import reduce
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from blog.fanout import chunked, get_chunk_size
+from blog.mailing import MailDelivery
+from blog.mailtemplates import mail_templates
+from blog.models import Article, ArticleList, CustomUser
+
+DIGEST_TEMPLATE = 'digest'
+
+DigestResult = namedtuple('DigestResult', ['users', 'articles', 'sent',
+                                           'failed', 'elapsed'])
+
+
+def default_window():
+    """Window of the users without a preference, BLOG_DIGEST_WINDOW."""
+    return getattr(settings, 'BLOG_DIGEST_WINDOW', CustomUser.IMMEDIATE)
+
+
+def immediate_subscribers(default=None):
+    """Filter on the profiles mailed for every article as it is published."""
+    default = default_window() if default is None else default
+    immediate = Q(digest=CustomUser.IMMEDIATE)
+    if default == CustomUser.IMMEDIATE:
+        immediate |= Q(digest__isnull=True)
+    return immediate
+
+
+def due_subscribers(now, default=None):
+    """Filter on the digest readers whose window has elapsed at ``now``."""
+    default = default_window() if default is None else default
+    due = []
+    windows = set([CustomUser.HOURLY, CustomUser.DAILY, default])
+    windows.discard(CustomUser.IMMEDIATE)
+    for window in windows:
+        chosen = Q(digest=window)
+        if window == default:
+            chosen |= Q(digest__isnull=True)
+        elapsed = Q(last_digest_at__isnull=True) | \
+            Q(last_digest_at__lte=now - timedelta(seconds=window))
+        due.append(chosen & elapsed)
+    return reduce(operator.or_, due)
+
+
+def unnotified():
+    """Filter on the ArticleList rows a digest still has to list."""
+    # deleted is nullable, NULL counts as not deleted.
+    return Q(notified=False, article__published=True) & \
+        ~Q(article__deleted=True)
+
+
+def send_digests(chunk_size=None):
+    """
+    Mails every due digest reader with an address one message listing the
+    articles they were not notified of yet. The ArticleList rows of the
+    messages that went out are marked notified and their readers' windows
+    restarted; a failed message is tried again on the next run. Readers
+    are handled ``chunk_size`` at a time, with one query for their rows
+    and one for their addresses.
+    """
+    started = time.time()
+    chunk_size = chunk_size or get_chunk_size()
+    now = timezone.now()
+    template = mail_templates.get(DIGEST_TEMPLATE)
+    readers = CustomUser.objects.filter(due_subscribers(now))\
+        .exclude(user__email='')
+    user_ids = ArticleList.objects.filter(unnotified(), user__in=readers)\
+        .order_by('user_id').values_list('user_id', flat=True).distinct()
+    users = articles = sent = failed = 0
+    for chunk in chunked(list(user_ids), chunk_size):
+        rows = ArticleList.objects.filter(unnotified(), user_id__in=chunk)\
+            .order_by('user_id', 'article__published_date')\
+            .values_list('pk', 'user_id', 'article__title', 'article__slug')
+        row_pks, listed = defaultdict(list), defaultdict(list)
+        for pk, user_id, title, slug in rows:
+            row_pks[user_id].append(pk)
+            url = 'http://127.0.0.1%s' % Article(slug=slug).get_absolute_url()
+            listed[user_id].append((title, url))
+        emails = dict(CustomUser.objects.filter(pk__in=list(listed))
+                      .values_list('pk', 'user__email'))
+        contexts = dict((emails[pk], {'articles': listed[pk],
+                                      'count': len(listed[pk])})
+                        for pk in listed)
+        result = MailDelivery(None, None, template.from_addr,
+                              retries=template.num_of_retries,
+                              template=template, contexts=contexts)\
+            .deliver(list(contexts))
+        undelivered = set(result.undelivered)
+        mailed = [pk for pk in listed if emails[pk] not in undelivered]
+        with transaction.atomic():
+            for pks in chunked([row for pk in mailed for row in row_pks[pk]],
+                               chunk_size):
+                ArticleList.objects.filter(pk__in=pks).update(notified=True)
+            CustomUser.objects.filter(pk__in=mailed)\
+                .update(last_digest_at=now)
+        users += len(listed)
+        articles += sum(len(row_pks[pk]) for pk in mailed)
+        sent += result.sent
+        failed += result.failed
+    return DigestResult(users, articles, sent, failed, time.time() - started)
@@ -0,0 +1,168 @@
+import time
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+from blog.digest import immediate_subscribers
+from blog.fanout import article_to_subscribers
+from blog.mailing import MailDelivery
+from blog.mailtemplates import mail_templates
+from blog.models import ArticleList, CustomUser, Notification, \
+    NotificationChunk
+
+DispatchResult = namedtuple('DispatchResult', ['chunks', 'recipients'])
+ChunkResult = namedtuple('ChunkResult', ['recipients', 'sent', 'failed',
+                                         'elapsed'])
+
+
+def get_recipient_chunk_size():
+    return getattr(settings, 'BLOG_NOTIFICATION_CHUNK_SIZE', 500)
+
+
+def get_chunk_lease():
+    return getattr(settings, 'BLOG_NOTIFICATION_CHUNK_LEASE', 600)
+
+
+def claimable(now, lease=None):
+    """Chunks not sent yet and not being sent, or whose claim expired."""
+    lease = get_chunk_lease() if lease is None else lease
+    return Q(status__in=[NotificationChunk.PENDING,
+                         NotificationChunk.FAILED]) | Q(
+        status=NotificationChunk.SENDING,
+        claimed_at__lt=now - timedelta(seconds=lease))
+
+
+def notification_context(article):
+    return {'article_title': article.title,
+            'article_url': 'http://127.0.0.1%s' % article.get_absolute_url()}
+
+
+def recipients_of(article, default=None):
+    """Subscribers mailed for the article as soon as it is published."""
+    if not article.blog_id:
+        return CustomUser.objects.none()
+    # Digest readers get the article with their next digest instead.
+    return article.blog.subscribers.filter(immediate_subscribers(default))
+
+
+def split(notification, chunk_size=None):
+    """
+    Creates the chunks of the notification: runs of ``chunk_size``
+    consecutive recipient pks, read with one query each.
+    """
+    chunk_size = chunk_size or get_recipient_chunk_size()
+    recipients = recipients_of(notification.article).order_by('pk')
+    chunks = []
+    last_pk = 0
+    while True:
+        pks = list(recipients.filter(pk__gt=last_pk)
+                   .values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            break
+        chunks.append(NotificationChunk(notification=notification,
+                                        first_user=pks[0], last_user=pks[-1],
+                                        recipients=len(pks)))
+        last_pk = pks[-1]
+    NotificationChunk.objects.bulk_create(chunks)
+    return chunks
+
+
+def dispatch(notification, chunk_size=None):
+    """
+    Queues one task per claimable chunk of the notification, splitting
+    the recipients first unless a previous claim already did. The article
+    is fanned out before the split, so the ArticleList rows the chunks
+    mark notified exist. The tasks only get the chunk pk.
+    """
+    from blog.tasks import send_notification_chunk
+    if not notification.chunks.exists():
+        article_to_subscribers(notification.article)
+        split(notification, chunk_size)
+    chunks = list(notification.chunks.filter(claimable(timezone.now()))
+                  .values_list('pk', 'recipients'))
+    for pk, _ in chunks:
+        send_notification_chunk.delay(pk)
+    return DispatchResult(len(chunks), sum(count for _, count in chunks))
+
+
+def complete(notification_pk):
+    """Marks the notification done if all its chunks are."""
+    return Notification.objects.filter(pk=notification_pk)\
+        .exclude(status=Notification.DONE)\
+        .exclude(chunks__status__in=[NotificationChunk.PENDING,
+                                     NotificationChunk.SENDING,
+                                     NotificationChunk.FAILED])\
+        .update(status=Notification.DONE, claimed_by='')
+
+
+def deliver_chunk(chunk_pk, lease=None):
+    """
+    Claims the chunk with a conditional UPDATE stamping a fresh token, then
+    mails its recipients, their addresses read with one query, and marks
+    the article notified for those the message reached. A chunk that is
+    done, or claimed by another run within the lease, is left alone. The
+    claim is renewed after every batch of messages; a run that lost it,
+    its lease having expired and another run having taken over, stops
+    sending. The outcome is recorded on the chunk and added to the
+    notification, which is done with its last chunk; an error marks the
+    chunk failed and is raised again.
+    """
+    started = time.time()
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    if not NotificationChunk.objects.filter(claimable(now, lease),
+                                            pk=chunk_pk)\
+            .update(status=NotificationChunk.SENDING, claimed_by=token,
+                    claimed_at=now, attempts=F('attempts') + 1):
+        return ChunkResult(0, 0, 0, time.time() - started)
+    chunk = NotificationChunk.objects\
+        .select_related('notification__article__blog').get(pk=chunk_pk)
+    article = chunk.notification.article
+    claimed = NotificationChunk.objects.filter(pk=chunk.pk, claimed_by=token)
+
+    def renew():
+        return bool(claimed.update(claimed_at=timezone.now()))
+
+    try:
+        template = mail_templates.get()
+        recipients = dict(
+            recipients_of(article)
+            .filter(pk__gte=chunk.first_user, pk__lte=chunk.last_user)
+            .values_list('pk', 'user__email'))
+        delivery = MailDelivery(None, None, template.from_addr,
+                                interval=template.interval,
+                                retries=template.num_of_retries,
+                                template=template,
+                                context=notification_context(article),
+                                heartbeat=renew)
+        result = delivery.deliver(list(recipients.values()))
+        undelivered = set(result.undelivered)
+        ArticleList.objects.filter(article=article, user_id__in=[
+            pk for pk, email in recipients.items()
+            if email and email not in undelivered]).update(notified=True)
+    except Exception as e:
+        claimed.update(status=NotificationChunk.FAILED, claimed_by='',
+                       error=repr(e))
+        raise
+    # A run whose lease expired meanwhile no longer holds the claim.
+    if claimed.update(status=NotificationChunk.DONE, claimed_by='',
+                      sent=result.sent, failed=result.failed, error=''):
+        Notification.objects.filter(pk=chunk.notification_id).update(
+            sent=F('sent') + result.sent, failed=F('failed') + result.failed)
+        complete(chunk.notification_id)
+    return ChunkResult(len(recipients), result.sent, result.failed,
+                       time.time() - started)
+
+
+def progress(notification):
+    """{chunk status: (chunks, recipients, sent, failed)}."""
+    rows = NotificationChunk.objects.filter(notification=notification)\
+        .order_by().values('status')\
+        .annotate(chunks=Count('pk'), recipients=Sum('recipients'),
+                  sent=Sum('sent'), failed=Sum('failed'))
+    return dict((row['status'], (row['chunks'], row['recipients'],
+                                 row['sent'], row['failed']))
+                for row in rows)
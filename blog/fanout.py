@@ -0,0 +1,96 @@
+import logging
+import time
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from blog.counters import add_unread
+from blog.models import ArticleList
+
+logger = logging.getLogger(__name__)
+
+FanOutResult = namedtuple('FanOutResult', ['inserted', 'elapsed'])
+
+
+def get_chunk_size():
+    return getattr(settings, 'BLOG_FANOUT_CHUNK_SIZE', 1000)
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _bulk_insert(pairs):
+    with transaction.atomic():
+        ArticleList.objects.bulk_create([ArticleList(article_id=article_id,
+                                                     user_id=user_id)
+                                         for article_id, user_id in pairs])
+        add_unread(Counter(user_id for _, user_id in pairs))
+    return len(pairs)
+
+
+def insert_pairs(pairs):
+    """
+    Inserts (article_id, user_id) pairs into ArticleList and counts them as
+    unread. Rows created in the meantime by a concurrent fan-out are
+    skipped, so the call is idempotent.
+    """
+    try:
+        return _bulk_insert(pairs)
+    except IntegrityError:
+        existing = set(ArticleList.objects
+                       .filter(article_id__in=set(p[0] for p in pairs),
+                               user_id__in=set(p[1] for p in pairs))
+                       .values_list('article_id', 'user_id'))
+        missing = [pair for pair in pairs if pair not in existing]
+        return _bulk_insert(missing) if missing else 0
+
+
+def _fan_out(pairs, chunk_size=None):
+    started = time.time()
+    inserted = 0
+    for chunk in chunked(pairs, chunk_size or get_chunk_size()):
+        inserted += insert_pairs(chunk)
+    return FanOutResult(inserted, time.time() - started)
+
+
+def article_to_subscribers(article, chunk_size=None):
+    """
+    Creates the missing ArticleList rows of the article for every subscriber
+    of its blog; drafts and deleted articles get none. The missing
+    subscribers are computed by one query.
+    """
+    if not article.blog_id or not article.is_published() or article.deleted:
+        return FanOutResult(0, 0.0)
+    user_ids = list(article.blog.subscribers
+                    .exclude(articlelist__article=article)
+                    .order_by().values_list('pk', flat=True))
+    result = _fan_out(((article.pk, user_id) for user_id in user_ids),
+                      chunk_size)
+    logger.info('Article %s fanned out to %d subscribers in %.3fs',
+                article.pk, result.inserted, result.elapsed)
+    return result
+
+
+def blog_to_subscriber(blog, user, chunk_size=None):
+    """
+    Creates the missing ArticleList rows of the published blog articles for
+    a new subscriber. The missing articles are computed by one query.
+    """
+    # deleted is nullable, NULL counts as not deleted.
+    article_ids = list(blog.article_set.filter(published=True)
+                       .exclude(deleted=True)
+                       .exclude(articlelist__user=user)
+                       .order_by().values_list('pk', flat=True))
+    result = _fan_out(((article_id, user.pk) for article_id in article_ids),
+                      chunk_size)
+    logger.info('Blog %s fanned out %d articles to user %s in %.3fs',
+                blog.pk, result.inserted, user.pk, result.elapsed)
+    return result
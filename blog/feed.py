@@ -1,5 +1,14 @@
+import hashlib
+import time
+
+from django.conf import settings
 from django.contrib.syndication.views import Feed
-from blog.models import Article
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.http import HttpRequest, HttpResponse, HttpResponseNotModified
+from django.shortcuts import get_object_or_404
+from django.utils.http import http_date, parse_http_date_safe
+from blog.models import Article, Blog, Category
 
 
 class LatestArticles(Feed):
@@ -9,5 +18,117 @@ class LatestArticles(Feed):
                   ' Invisible fonts? No, have never heard.'
 
     def items(self):
-        return Article.objects.filter(published=True)[:8]
+        return Article.objects.filter(published=True)\
+            .order_by('-published_date')[:8]
+
+
+class BlogArticles(LatestArticles):
+
+    def get_object(self, request, pk):
+        return get_object_or_404(Blog, pk=pk, deleted=False)
+
+    def title(self, obj):
+        return obj.name
+
+    def link(self, obj):
+        return reverse('feed-blog', args=[obj.pk])
+
+    def items(self, obj):
+        return Article.objects.filter(published=True, blog=obj)\
+            .order_by('-published_date')[:8]
+
+
+class CategoryArticles(LatestArticles):
+
+    def get_object(self, request, pk):
+        return get_object_or_404(Category, pk=pk)
+
+    def title(self, obj):
+        return obj.name
+
+    def link(self, obj):
+        return reverse('feed-category', args=[obj.pk])
+
+    def items(self, obj):
+        return Article.objects.filter(published=True, category=obj)\
+            .order_by('-published_date')[:8]
+
+
+FEEDS = {
+    'latest': LatestArticles(),
+    'blog': BlogArticles(),
+    'category': CategoryArticles(),
+}
+
+
+def feed_cache_key(kind, pk=None):
+    return 'feed:%s:%s' % (kind, pk or '')
+
+
+def get_timeout():
+    return getattr(settings, 'BLOG_FEED_CACHE_TIMEOUT', 10 * 60)
+
+
+def _feed_request():
+    request = HttpRequest()
+    request.META = {'SERVER_NAME': getattr(settings, 'BLOG_FEED_HOST',
+                                           '127.0.0.1'),
+                    'SERVER_PORT': '80'}
+    return request
+
+
+def render_feed(kind, pk=None):
+    """
+    Renders the feed XML and stores it in the cache together with its
+    ETag. Last-Modified only moves when the content actually changes.
+    Entries expire after BLOG_FEED_CACHE_TIMEOUT, so a render lost by the
+    workers leaves a feed stale for that long at most.
+    """
+    feed = FEEDS[kind]
+    request = _feed_request()
+    obj = feed.get_object(request, *([pk] if pk else []))
+    content = feed.get_feed(obj, request).writeString('utf-8')\
+        .encode('utf-8')
+    etag = '"%s"' % hashlib.md5(content).hexdigest()
+    key = feed_cache_key(kind, pk)
+    previous = cache.get(key)
+    if previous and previous['etag'] == etag:
+        entry = previous
+    else:
+        entry = {'content': content, 'etag': etag,
+                 'content_type': feed.feed_type.content_type,
+                 'last_modified': int(time.time())}
+    cache.set(key, entry, get_timeout())
+    return entry
+
+
+def prerender_article_feeds(article):
+    render_feed('latest')
+    if article.blog_id:
+        render_feed('blog', article.blog_id)
+    for category_pk in article.category.values_list('pk', flat=True):
+        render_feed('category', category_pk)
+
+
+def _not_modified(request, entry):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        etags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in etags or entry['etag'] in etags or \
+            'W/' + entry['etag'] in etags
+    if_modified_since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE'))
+    return if_modified_since is not None and \
+        entry['last_modified'] <= if_modified_since
+
 
+def cached_feed(request, kind='latest', pk=None):
+    entry = cache.get(feed_cache_key(kind, pk)) or render_feed(kind, pk)
+    if _not_modified(request, entry):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry['content'],
+                                content_type=entry['content_type'])
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    return response
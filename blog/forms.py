@@ -1,7 +1,9 @@
 import re
 from collections import OrderedDict
 from django.forms import Form, ModelForm, BaseModelFormSet, BooleanField, CharField
-from blog.models import Article, Blog, ArticleList, CustomUser
+from blog.models import Article, ArticleComment, Blog, ArticleList, \
+    CustomUser
+from blog.avatars import store_avatar
 from django.db import transaction
 from django.forms import BooleanField, CharField, ChoiceField, RegexField, \
     FileField, ModelForm
@@ -24,6 +26,12 @@ class ArticleUpdatingForm(ModelForm):
         fields = ['name', 'title', 'description', 'content']
 
 
+class ArticleCommentForm(ModelForm):
+    class Meta:
+        model = ArticleComment
+        fields = ['content']
+
+
 class BlogSubscribeForm(Form):
     blog_name = CharField(max_length=512)
     author_name = CharField(max_length=128)
@@ -134,7 +142,7 @@ class CustomUserCreateForm(CustomUserFormBase, UserCreationForm):
 
     class Meta:
         model = CustomUser
-        exclude = ('user',)
+        exclude = ('user', 'unread_count', 'last_digest_at')
 
 
 class CustomUserUpdateForm(CustomUserFormBase, UserChangeForm):
@@ -143,7 +151,7 @@ class CustomUserUpdateForm(CustomUserFormBase, UserChangeForm):
 
     class Meta:
         model = CustomUser
-        exclude = ('user', 'avatar')
+        exclude = ('user', 'avatar', 'unread_count', 'last_digest_at')
 
     def __init__(self, *args, **kwargs):
         super(CustomUserUpdateForm, self).__init__(*args, **kwargs)
@@ -169,7 +177,8 @@ class CustomUserUpdateForm(CustomUserFormBase, UserChangeForm):
 
     def save(self, commit=True):
         custom_user = super(CustomUserUpdateForm, self).save(commit)
-        custom_user.avatar = self.cleaned_data['avatar']
+        if self.cleaned_data['avatar']:
+            custom_user.avatar = store_avatar(self.cleaned_data['avatar'])
         if commit:
             custom_user.user.save()
             custom_user.save()
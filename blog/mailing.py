@@ -0,0 +1,144 @@
+import socket
+import time
+import uuid
+from collections import namedtuple
+from smtplib import SMTPException, SMTPServerDisconnected
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.utils import timezone
+from blog.fanout import chunked
+from blog.models import Mail
+from tryit.celery import worker_connection, reset_worker_connection
+
+DeliveryResult = namedtuple('DeliveryResult', ['sent', 'failed', 'elapsed',
+                                               'undelivered'])
+
+
+class MailDelivery(object):
+    """
+    Sends one message to many recipients over a single SMTP session.
+
+    Recipients are processed in batches: the Mail rows of a batch are
+    created and updated in bulk, and the connection stays open between
+    messages. ``interval`` is the minimal delay in seconds between two
+    messages, ``retries`` is the number of extra attempts a failed message
+    gets, each one after an exponentially growing pause. With a compiled
+    ``template`` every message is rendered from ``context`` plus the
+    ``recipient`` address and what ``contexts`` holds for that address.
+    ``heartbeat`` is called after every batch; when it returns False the
+    remaining recipients are left unsent.
+    """
+
+    def __init__(self, subject, message, from_addr, interval=None, retries=0,
+                 batch_size=None, backoff=None, connection=None,
+                 message_kwargs=None, template=None, context=None,
+                 contexts=None, heartbeat=None):
+        self.subject = subject
+        self.message = message
+        self.from_addr = from_addr or (template and template.from_addr)
+        self.interval = interval or 0
+        self.retries = retries or 0
+        self.batch_size = batch_size or getattr(
+            settings, 'BLOG_MAIL_BATCH_SIZE', 100)
+        self.backoff = backoff if backoff is not None else getattr(
+            settings, 'BLOG_MAIL_RETRY_BACKOFF', 1.0)
+        self._connection = connection
+        self.message_kwargs = message_kwargs or {}
+        self.template = template
+        self.context = context or {}
+        self.contexts = contexts or {}
+        self.heartbeat = heartbeat
+        self._last_sent = 0
+
+    def connection(self):
+        if self._connection is not None:
+            return self._connection
+        return worker_connection()
+
+    def reset_connection(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection.open()
+        else:
+            reset_worker_connection()
+
+    def deliver(self, recipients):
+        """
+        Mails every address; the result lists the addresses whose message
+        still failed after the retries or was never sent because the
+        heartbeat stopped the delivery.
+        """
+        started = time.time()
+        sent, failed, skipped = 0, [], []
+        batches = chunked((addr for addr in recipients if addr),
+                          self.batch_size)
+        for batch in batches:
+            batch_sent, batch_failed = self._deliver_batch(batch)
+            sent += batch_sent
+            failed.extend(batch_failed)
+            if self.heartbeat is not None and not self.heartbeat():
+                skipped = [addr for rest in batches for addr in rest]
+                break
+        return DeliveryResult(sent, len(failed), time.time() - started,
+                              failed + skipped)
+
+    def _message(self, addr):
+        subject, body = self.subject, self.message
+        if self.template is not None:
+            context = dict(self.context, recipient=addr)
+            context.update(self.contexts.get(addr, {}))
+            subject, body = self.template.render(context)
+        return EmailMessage(subject, body, from_email=self.from_addr,
+                            to=[addr], **self.message_kwargs)
+
+    def _queue(self, addresses):
+        names = [uuid.uuid4().hex for _ in addresses]
+        Mail.objects.bulk_create([Mail(name=name, to_addr=addr)
+                                  for name, addr in zip(names, addresses)])
+        return list(Mail.objects.filter(name__in=names))
+
+    def _throttle(self):
+        if self.interval:
+            delay = self._last_sent + self.interval - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        self._last_sent = time.time()
+
+    def _send(self, message):
+        self._throttle()
+        try:
+            return self.connection().send_messages([message]) == 1
+        except SMTPServerDisconnected:
+            self.reset_connection()
+        except (SMTPException, socket.error):
+            pass
+        return False
+
+    def _deliver_batch(self, addresses):
+        pending = [(mail, self._message(mail.to_addr))
+                   for mail in self._queue(addresses)]
+        sent = 0
+        attempt = 0
+        while pending:
+            attempt += 1
+            delivered, failed = [], []
+            for mail, message in pending:
+                (delivered if self._send(message) else failed).append(
+                    (mail, message))
+            Mail.objects.filter(pk__in=[mail.pk for mail, _ in delivered])\
+                .update(sended=True, status=Mail.SENT, attempts=attempt,
+                        sending_date=timezone.now())
+            sent += len(delivered)
+            failed_pks = [mail.pk for mail, _ in failed]
+            if not failed:
+                break
+            if attempt > self.retries:
+                Mail.objects.filter(pk__in=failed_pks).update(
+                    sended=False, status=Mail.FAILED, attempts=attempt)
+                return sent, [mail.to_addr for mail, _ in failed]
+            Mail.objects.filter(pk__in=failed_pks).update(
+                status=Mail.RETRYING, attempts=attempt)
+            time.sleep(self.backoff * 2 ** (attempt - 1))
+            pending = failed
+        return sent, []
@@ -0,0 +1,79 @@
+import threading
+import uuid
+
+from django.apps import apps
+from django.core.cache import cache
+from django.template import Context, Template
+
+VERSION_KEY = 'mailtemplates:version'
+ARTICLE_LINK = ': and you can find the article here {{ article_url }}'
+
+
+def _compile(source):
+    return Template('{% autoescape off %}' + source + '{% endautoescape %}')
+
+
+class CompiledMailTemplate(object):
+    """
+    Parsed subject and body of a MailTemplate, rendered per recipient
+    without parsing them again.
+    """
+
+    def __init__(self, template):
+        self.slug = template.slug
+        self.from_addr = template.from_addr
+        self.interval = template.interval
+        self.num_of_retries = template.num_of_retries
+        message = template.message
+        if 'article_url' not in message:
+            # Templates written without placeholders get the article link
+            # appended, as notifications always did.
+            message += ARTICLE_LINK
+        self.subject = _compile(template.subject)
+        self.message = _compile(message)
+
+    def render(self, context=None):
+        context = Context(context or {})
+        return self.subject.render(context).strip(), \
+            self.message.render(context)
+
+
+class MailTemplateRegistry(object):
+    """
+    Resolves mail templates by slug, falling back to the default one, and
+    keeps them compiled in memory. Saving a MailTemplate stores a new
+    random version token in the shared cache, which drops the compiled
+    templates of every process on their next lookup. A token evicted from
+    the cache is replaced by a fresh one rather than a counter restarting
+    at a value some process has already seen.
+    """
+
+    def __init__(self):
+        self._templates = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, slug=None):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(VERSION_KEY)
+        with self._lock:
+            if version != self._version:
+                self._templates = {}
+                self._version = version
+            compiled = self._templates.get(slug)
+        if compiled is None:
+            compiled = CompiledMailTemplate(
+                apps.get_model('blog', 'MailTemplate').get_template(slug))
+            with self._lock:
+                self._templates[slug] = compiled
+        return compiled
+
+    def invalidate(self):
+        cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+        with self._lock:
+            self._templates = {}
+
+
+mail_templates = MailTemplateRegistry()
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from blog.models import CustomUser, TimelineEntry
+from blog.queryaudit import PlanAuditor, hot_urls
+from blog.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = 'Requests the hot pages, explains every SELECT they run and ' \
+           'reports sequential scans and sorts over large tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', default=None,
+                            help='Reader to audit the pages as. Without it '
+                                 'a dataset is seeded and rolled back.')
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--blogs', type=int, default=50)
+        parser.add_argument('--articles', type=int, default=5000)
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help='Smallest table worth reporting.')
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--verbose-plans', action='store_true')
+
+    def audit(self, options):
+        username = options['username']
+        if username is None:
+            username = 'audit-0'
+            Seeder(users=options['users'], blogs=options['blogs'],
+                   articles=options['articles'], prefix='audit').run()
+        try:
+            reader = CustomUser.objects.select_related('user')\
+                .get(user__username=username)
+        except CustomUser.DoesNotExist:
+            raise CommandError('No profile for %s' % username)
+        slug = TimelineEntry.objects.filter(user=reader)\
+            .values_list('slug', flat=True).first()
+        client = Client(HTTP_HOST=options['host'])
+        client.force_login(reader.user)
+        try:
+            auditor = PlanAuditor(connection, options['min_rows'])
+            return auditor.audit_urls(client, hot_urls(slug))
+        except ValueError as e:
+            raise CommandError(str(e))
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            findings = self.audit(options)
+            transaction.set_rollback(True)
+        for finding in findings:
+            self.stdout.write('%s: %s on %s (%d rows)\n  %s' % (
+                finding.url, finding.kind, finding.table or '-',
+                finding.rows, finding.sql))
+            if options['verbose_plans']:
+                self.stdout.write('  ' + finding.plan.replace('\n', '\n  '))
+        if findings:
+            raise CommandError('%d plan(s) need an index' % len(findings))
+        self.stdout.write('No sequential scan or sort over %d rows'
+                          % options['min_rows'])
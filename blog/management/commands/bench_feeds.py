@@ -0,0 +1,36 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.core.urlresolvers import reverse
+from django.test import Client
+from blog.feed import feed_cache_key
+
+
+class Command(BaseCommand):
+    help = 'Measures requests per second of cold, warm and conditional feeds.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--host', default='127.0.0.1')
+
+    def run(self, client, url, key, cold=False, headers=None):
+        started = time.time()
+        for _ in range(self.requests):
+            if cold:
+                cache.delete(key)
+            response = client.get(url, **(headers or {}))
+        elapsed = time.time() - started
+        return response, self.requests / elapsed if elapsed else 0
+
+    def handle(self, *args, **options):
+        self.requests = options['requests']
+        client = Client(HTTP_HOST=options['host'])
+        url, key = reverse('feed'), feed_cache_key('latest')
+        _, cold = self.run(client, url, key, cold=True)
+        response, warm = self.run(client, url, key)
+        _, conditional = self.run(
+            client, url, key, headers={'HTTP_IF_NONE_MATCH': response['ETag']})
+        self.stdout.write('cold: %.1f req/s' % cold)
+        self.stdout.write('warm: %.1f req/s' % warm)
+        self.stdout.write('conditional (304): %.1f req/s' % conditional)
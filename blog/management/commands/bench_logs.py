@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from tryit.logs import GzipLogWriter, read_records
+
+
+class Command(BaseCommand):
+    help = 'Measures compressed log throughput and compression ratio.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=100000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        count = options['records']
+        try:
+            writer = GzipLogWriter(directory, 'bench',
+                                   batch_size=options['batch_size'],
+                                   max_bytes=2 ** 62)
+            raw_bytes = 0
+            started = time.time()
+            for i in range(count):
+                record = ('%.6f INFO article %d sent to subscriber %d'
+                          % (time.time(), i % 5000, i)).encode('ascii')
+                raw_bytes += len(record)
+                writer.write(record)
+            writer.close()
+            written = time.time() - started
+            stored_bytes = os.path.getsize(writer.path)
+            started = time.time()
+            read = sum(1 for _ in read_records(writer.path))
+            reading = time.time() - started
+        finally:
+            shutil.rmtree(directory)
+        self.stdout.write('write: %d records in %.2fs (%.0f records/s)'
+                          % (count, written, count / written))
+        self.stdout.write('read: %d records in %.2fs (%.0f records/s)'
+                          % (read, reading, read / reading))
+        self.stdout.write('compression: %d -> %d bytes (ratio %.1f)'
+                          % (raw_bytes, stored_bytes,
+                             float(raw_bytes) / stored_bytes))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.template import Context, Template
+from blog.mailtemplates import mail_templates
+
+
+class Command(BaseCommand):
+    help = 'Measures rendering of personalized notification messages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=100000)
+        parser.add_argument('--slug', default=None)
+
+    def measure(self, render):
+        started = time.time()
+        for i in range(self.messages):
+            render({'recipient': 'user%d@example.com' % i,
+                    'article_title': 'Benchmark',
+                    'article_url': 'http://127.0.0.1/article/1-benchmark'})
+        elapsed = time.time() - started
+        return elapsed, self.messages / elapsed if elapsed else 0
+
+    def handle(self, *args, **options):
+        self.messages = options['messages']
+        compiled = mail_templates.get(options['slug'])
+        subject = compiled.subject.source
+        message = compiled.message.source
+
+        def parse_each_time(context):
+            context = Context(context)
+            return Template(subject).render(context), \
+                Template(message).render(context)
+
+        for name, render in (('parsed per message', parse_each_time),
+                             ('precompiled', compiled.render)):
+            elapsed, rate = self.measure(render)
+            self.stdout.write('%s: %d messages in %.2fs (%.0f messages/s)'
+                              % (name, self.messages, elapsed, rate))
@@ -0,0 +1,83 @@
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from blog.mailing import MailDelivery
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Accepts every message and throws it away."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost sink')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.strip().split(b' ')[0].upper()
+            if command in (b'EHLO', b'HELO'):
+                self.reply('250 localhost')
+            elif command == b'DATA':
+                self.reply('354 end with <CR><LF>.<CR><LF>')
+                while self.rfile.readline().rstrip(b'\r\n') != b'.':
+                    pass
+                self.server.received += 1
+                self.reply('250 OK')
+            elif command == b'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    received = 0
+
+
+class Command(BaseCommand):
+    help = 'Measures notification mail throughput against a local SMTP sink.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        sink = SMTPSink(('127.0.0.1', 0), SMTPSinkHandler)
+        thread = threading.Thread(target=sink.serve_forever)
+        thread.daemon = True
+        thread.start()
+        host, port = sink.server_address
+        connection = get_connection(
+            'django.core.mail.backends.smtp.EmailBackend',
+            host=host, port=port, use_tls=False, use_ssl=False,
+            username='', password='')
+        recipients = ['user%d@example.com' % i
+                      for i in range(options['messages'])]
+        delivery = MailDelivery('Benchmark', 'Benchmark body',
+                                'bench@example.com', connection=connection,
+                                batch_size=options['batch_size'])
+        try:
+            with transaction.atomic():
+                connection.open()
+                result = delivery.deliver(recipients)
+                connection.close()
+                transaction.set_rollback(True)
+        finally:
+            sink.shutdown()
+            sink.server_close()
+        rate = result.sent / result.elapsed if result.elapsed else 0
+        self.stdout.write('sent %d, failed %d, received by sink %d in %.2fs '
+                          '(%.1f messages/s)' % (result.sent, result.failed,
+                                                 sink.received,
+                                                 result.elapsed, rate))
@@ -0,0 +1,112 @@
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from blog.models import CustomUser, TimelineEntry
+from blog.seeding import Seeder
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the blog views against a seeded synthetic dataset. ' \
+           'The dataset is rolled back afterwards.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--blogs', type=int, default=20)
+        parser.add_argument('--articles', type=int, default=20,
+                            help='Articles per blog.')
+        parser.add_argument('--subscriptions', type=int, default=5,
+                            help='Subscriptions per user.')
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Requests per view.')
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--output', default='bench_results.json')
+        parser.add_argument('--baseline', default=None,
+                            help='Results file to compare against.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed relative regression, 0.2 is 20%%.')
+
+    def measure(self, client, url):
+        latencies, queries = [], []
+        tracemalloc.start()
+        try:
+            for _ in range(self.requests):
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.time()
+                    response = client.get(url)
+                    latencies.append((time.time() - started) * 1000)
+                if response.status_code != 200:
+                    raise CommandError('%s answered %d'
+                                       % (url, response.status_code))
+                queries.append(len(captured))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {'p50_ms': percentile(latencies, 0.5),
+                'p95_ms': percentile(latencies, 0.95),
+                'p99_ms': percentile(latencies, 0.99),
+                'queries': float(sum(queries)) / len(queries),
+                'peak_memory_kb': peak / 1024.0}
+
+    def run(self, options):
+        Seeder(users=options['users'], blogs=options['blogs'],
+               articles=options['blogs'] * options['articles'],
+               subscriptions=options['subscriptions'], prefix='bench').run()
+        reader = CustomUser.objects.select_related('user')\
+            .get(user__username='bench-0')
+        slug = TimelineEntry.objects.filter(user=reader)\
+            .values_list('slug', flat=True).first()
+        client = Client(HTTP_HOST=options['host'])
+        client.force_login(reader.user)
+        views = [('articles-get', reverse('articles-get')),
+                 ('blog-subscribe', reverse('blog-subscribe')),
+                 ('feed', reverse('feed'))]
+        if slug:
+            views.append(('article-get', reverse('article-get', args=[slug])))
+        return dict((name, self.measure(client, url)) for name, url in views)
+
+    def compare(self, results, baseline, threshold):
+        regressions = []
+        for view, metrics in results.items():
+            for metric in ('p50_ms', 'p95_ms', 'queries'):
+                before = baseline.get(view, {}).get(metric)
+                if before and metrics[metric] > before * (1 + threshold):
+                    regressions.append('%s %s: %.2f -> %.2f' % (
+                        view, metric, before, metrics[metric]))
+        return regressions
+
+    def handle(self, *args, **options):
+        self.requests = options['requests']
+        with transaction.atomic():
+            results = self.run(options)
+            transaction.set_rollback(True)
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        for view, metrics in sorted(results.items()):
+            self.stdout.write(
+                '%-15s p50 %7.2fms  p95 %7.2fms  p99 %7.2fms  '
+                '%5.1f queries  peak %8.1fKB' % (
+                    view, metrics['p50_ms'], metrics['p95_ms'],
+                    metrics['p99_ms'], metrics['queries'],
+                    metrics['peak_memory_kb']))
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            regressions = self.compare(results, baseline,
+                                       options['threshold'])
+            if regressions:
+                raise CommandError('Regressions over %d%%:\n%s' % (
+                    options['threshold'] * 100, '\n'.join(regressions)))
+            self.stdout.write('No regression over %d%% against %s' % (
+                options['threshold'] * 100, options['baseline']))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from blog.transfer import Exporter, open_jsonl
+
+
+class Command(BaseCommand):
+    help = 'Streams categories, blogs with their subscribers, articles, ' \
+           'article categories and article lists to a JSON Lines file. ' \
+           'References are written as names and usernames.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='File to write, gzipped when '
+                                           'its name ends with .gz.')
+        parser.add_argument('--gzip', action='store_true', default=None,
+                            help='Gzip the output whatever its name.')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Rows read per query.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('The chunk size must be positive.')
+        exporter = Exporter(chunk_size=options['chunk_size'])
+        with open_jsonl(options['output'], 'w',
+                        compress=options['gzip']) as stream:
+            exporter.export(stream)
+        for line in exporter.report():
+            self.stdout.write(line)
@@ -0,0 +1,43 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from blog.models import CustomImage
+
+
+class Command(BaseCommand):
+    help = 'Removes avatar images no user refers to, and orphaned files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', default=False)
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        # The oldest image is the default avatar, see get_default_img.
+        default = CustomImage.objects.order_by('pk').first()
+        unreferenced = CustomImage.objects.filter(customuser__isnull=True)
+        if default is not None:
+            unreferenced = unreferenced.exclude(pk=default.pk)
+        images = len(unreferenced)
+        if not dry_run:
+            unreferenced.delete()
+        kept = set()
+        for img, thumbnail in CustomImage.objects.values_list('img',
+                                                              'thumbnail'):
+            kept.update(os.path.normpath(default_storage.path(name))
+                        for name in (img, thumbnail) if name)
+        files = 0
+        root = default_storage.path(settings.AVATAR_DIR)
+        uploads = os.path.join(root, 'tmp')
+        for directory, _, names in os.walk(root):
+            if directory.startswith(uploads):
+                continue
+            for name in names:
+                path = os.path.normpath(os.path.join(directory, name))
+                if path not in kept:
+                    files += 1
+                    if not dry_run:
+                        os.remove(path)
+        self.stdout.write('%s %d unreferenced images and %d orphaned files'
+                          % ('Found' if dry_run else 'Removed', images, files))
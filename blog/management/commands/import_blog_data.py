@@ -0,0 +1,54 @@
+import io
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from blog.transfer import Importer, open_jsonl
+
+
+class Command(BaseCommand):
+    help = 'Loads a file written by export_blog_data. Users must exist ' \
+           'already; rows referring to unknown ones are skipped, as are ' \
+           'rows already in the database. Imported articles are indexed ' \
+           'for search and added to the timelines of their subscribers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='File to read, gzipped when its '
+                                          'name ends with .gz.')
+        parser.add_argument('--gzip', action='store_true', default=None,
+                            help='Read the input as gzip whatever its name.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Records inserted per transaction.')
+        parser.add_argument('--checkpoint',
+                            help='File keeping the number of lines done, '
+                                 'by default the input name + .checkpoint.')
+        parser.add_argument('--resume', action='store_true',
+                            help='Skip the lines the checkpoint says are '
+                                 'done.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('The batch size must be positive.')
+        path = options['checkpoint'] or options['input'] + '.checkpoint'
+        start = 0
+        if options['resume'] and os.path.exists(path):
+            with io.open(path) as f:
+                start = int(f.read().strip() or 0)
+            self.stdout.write('Resuming after line %d.' % start)
+
+        def checkpoint(done):
+            # Written aside then renamed, a crash never leaves half a number.
+            with io.open(path + '.tmp', 'w') as f:
+                f.write(u'%d\n' % done)
+            os.rename(path + '.tmp', path)
+
+        importer = Importer(batch_size=options['batch_size'])
+        with open_jsonl(options['input'], 'r',
+                        compress=options['gzip']) as stream:
+            try:
+                importer.run(stream, start=start, checkpoint=checkpoint)
+            except ValueError as e:
+                raise CommandError('%s; rerun with --resume once fixed.' % e)
+        for line in importer.report():
+            self.stdout.write(line)
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from blog.models import Article, SearchPosting
+from blog.search import postings_for
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the article search index from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = time.time()
+        articles = Article.objects.filter(published=True)\
+            .exclude(deleted=True).order_by('pk')\
+            .only('title', 'description', 'content', 'blog')
+        SearchPosting.objects.all().delete()
+        last_pk = indexed = postings = 0
+        while True:
+            chunk = list(articles.filter(pk__gt=last_pk)
+                         [:options['chunk_size']])
+            if not chunk:
+                break
+            rows = []
+            for article in chunk:
+                rows.extend(postings_for(article))
+            with transaction.atomic():
+                SearchPosting.objects.bulk_create(rows)
+            last_pk = chunk[-1].pk
+            indexed += len(chunk)
+            postings += len(rows)
+        self.stdout.write('Indexed %d articles (%d postings) in %.2fs'
+                          % (indexed, postings, time.time() - started))
@@ -0,0 +1,38 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from blog.counters import counted
+from blog.models import ArticleList, CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Repairs unread counters that drifted from the ArticleList rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.order_by('pk')\
+            .values_list('pk', 'unread_count')
+        last_pk = checked = repaired = 0
+        while True:
+            chunk = list(users.filter(pk__gt=last_pk)[:options['chunk_size']])
+            if not chunk:
+                break
+            pks = [pk for pk, _ in chunk]
+            actual = dict(counted(ArticleList.objects
+                                  .filter(user_id__in=pks)).order_by()
+                          .values_list('user').annotate(count=Count('pk')))
+            by_count = defaultdict(list)
+            for pk, stored in chunk:
+                if actual.get(pk, 0) != stored:
+                    by_count[actual.get(pk, 0)].append(pk)
+            for count, drifted in by_count.items():
+                CustomUser.objects.filter(pk__in=drifted)\
+                    .update(unread_count=count)
+                repaired += len(drifted)
+            checked += len(chunk)
+            last_pk = pks[-1]
+        self.stdout.write('Checked %d users, repaired %d counters'
+                          % (checked, repaired))
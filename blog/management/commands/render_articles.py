@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from blog.cache import article_cache
+from blog.models import Article, TimelineEntry
+from blog.rendering import render_article
+
+
+class Command(BaseCommand):
+    help = 'Renders the stored HTML, excerpt and word count of the ' \
+           'articles saved before content was rendered at save time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--all', action='store_true',
+                            help='Render every article again.')
+
+    def handle(self, *args, **options):
+        started = time.time()
+        articles = Article.objects.order_by('pk')\
+            .only('slug', 'description', 'content', 'excerpt')
+        if not options['all']:
+            articles = articles.filter(content_html='').exclude(content='')
+        last_pk = rendered = 0
+        while True:
+            chunk = list(articles.filter(pk__gt=last_pk)
+                         [:options['chunk_size']])
+            if not chunk:
+                break
+            with transaction.atomic():
+                for article in chunk:
+                    excerpt = article.excerpt
+                    render_article(article)
+                    Article.objects.filter(pk=article.pk).update(
+                        content_html=article.content_html,
+                        excerpt=article.excerpt,
+                        word_count=article.word_count)
+                    if article.excerpt != excerpt:
+                        TimelineEntry.objects.filter(article_id=article.pk)\
+                            .update(excerpt=article.excerpt)
+            for article in chunk:
+                article_cache.invalidate(article.slug)
+            last_pk = chunk[-1].pk
+            rendered += len(chunk)
+        elapsed = time.time() - started
+        self.stdout.write('Rendered %d articles in %.2fs (%.0f/s)' % (
+            rendered, elapsed, rendered / elapsed if elapsed else 0))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from blog.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with a large synthetic dataset: users, ' \
+           'blogs, categories, articles, subscriptions and the article ' \
+           'lists and timelines derived from them. No mail is sent.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--blogs', type=int, default=100)
+        parser.add_argument('--articles', type=int, default=100000,
+                            help='Articles in total.')
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--subscriptions', type=int, default=5,
+                            help='Mean subscriptions per user.')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Skew of blog popularity, 0 is uniform.')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Rows per insert; keep it below 999 on '
+                                 'SQLite.')
+        parser.add_argument('--prefix', default='seed',
+                            help='Prefix of every generated name.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['blogs'] < 1:
+            raise CommandError('At least one user and one blog are needed.')
+        seeder = Seeder(users=options['users'], blogs=options['blogs'],
+                        articles=options['articles'],
+                        categories=options['categories'],
+                        subscriptions=options['subscriptions'],
+                        zipf=options['zipf'], prefix=options['prefix'],
+                        seed=options['seed'],
+                        chunk_size=options['chunk_size'], stdout=self.stdout)
+        seeder.run()
+        for line in seeder.report():
+            self.stdout.write(line)
+        self.stdout.write('Run rebuild_search_index to index the articles.')
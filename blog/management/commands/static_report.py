@@ -0,0 +1,70 @@
+import json
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from blog.assets import is_hashed, page_assets
+from blog.storage import compressors
+
+
+class Command(BaseCommand):
+    help = 'Reports the static bytes a first view of a page downloads, ' \
+           'raw and with the precompressed files collectstatic built.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', default='/')
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--output', default=None,
+                            help='Write the totals to this JSON file.')
+        parser.add_argument('--baseline', default=None,
+                            help='Totals file to compare against.')
+
+    def sizes(self, name):
+        collected = os.path.join(settings.STATIC_ROOT, name)
+        path = collected if os.path.isfile(collected) else finders.find(name)
+        if not path:
+            raise CommandError('%s was not found' % name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        sizes = {'raw': len(data), 'served': len(data)}
+        for suffix, compress in compressors():
+            sibling = path + suffix
+            if os.path.isfile(sibling):
+                size = os.path.getsize(sibling)
+            else:
+                size = len(compress(data))
+            sizes[suffix.lstrip('.')] = size
+            if os.path.isfile(sibling):
+                sizes['served'] = min(sizes['served'], size)
+        return sizes
+
+    def handle(self, *args, **options):
+        response = Client(HTTP_HOST=options['host']).get(options['page'])
+        if response.status_code != 200:
+            raise CommandError('%s answered %d' % (options['page'],
+                                                   response.status_code))
+        totals = {'assets': 0, 'raw': 0, 'served': 0, 'cacheable': 0}
+        for name in page_assets(response.content.decode('utf-8')):
+            sizes = self.sizes(name)
+            cacheable = is_hashed(name)
+            self.stdout.write('%-50s raw %8d  gz %8d  br %8s  served %8d%s' % (
+                name, sizes['raw'], sizes['gz'], sizes.get('br', '-'),
+                sizes['served'], '  cached 1y' if cacheable else ''))
+            totals['assets'] += 1
+            totals['raw'] += sizes['raw']
+            totals['served'] += sizes['served']
+            totals['cacheable'] += sizes['served'] if cacheable else 0
+        self.stdout.write('First view: %(assets)d assets, %(raw)d bytes raw, '
+                          '%(served)d bytes served, %(cacheable)d of them '
+                          'cacheable' % totals)
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            self.stdout.write('Before: %d bytes served, after: %d (%+d)' % (
+                baseline['served'], totals['served'],
+                totals['served'] - baseline['served']))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(totals, f, indent=2, sort_keys=True)
@@ -0,0 +1,184 @@
+import random
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from django.template.backends import django as django_backend
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+from blog.profiles import load_profile
+
+# Upper bounds in milliseconds of the histogram buckets.
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000,
+           float('inf'))
+
+_local = threading.local()
+
+
+def _timed_render(render):
+    def wrapper(self, *args, **kwargs):
+        started = time.time()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            if getattr(_local, 'template_time', None) is not None:
+                _local.template_time += time.time() - started
+    wrapper.timed = True
+    return wrapper
+
+
+class Histogram(object):
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, fraction):
+        """
+        Upper bound of the bucket holding the percentile, or the largest
+        value seen when that is lower, so the open last bucket reports the
+        observed maximum rather than infinity.
+        """
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(bound, self.max)
+        return None
+
+    def as_dict(self):
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else None,
+                'p50': self.percentile(0.5), 'p95': self.percentile(0.95),
+                'p99': self.percentile(0.99), 'max': self.max,
+                'buckets': dict(('le_%s' % bound, count) for bound, count
+                                in zip(BUCKETS, self.counts) if count)}
+
+
+class ViewStats(object):
+
+    def __init__(self):
+        self.total = Histogram()
+        self.sql = Histogram()
+        self.template = Histogram()
+        self.queries = Histogram()
+        self.slowest = None
+
+    def add(self, record):
+        self.total.add(record['total'])
+        self.sql.add(record['sql_time'])
+        self.template.add(record['template_time'])
+        self.queries.add(record['queries'])
+        slowest = record['slowest']
+        if slowest and (self.slowest is None or
+                        slowest['time'] > self.slowest['time']):
+            self.slowest = slowest
+
+    def as_dict(self):
+        return {'total_ms': self.total.as_dict(),
+                'sql_ms': self.sql.as_dict(),
+                'template_ms': self.template.as_dict(),
+                'queries': self.queries.as_dict(),
+                'slowest_query': self.slowest}
+
+
+class PerformanceStats(object):
+    """Per URL name aggregates of the sampled requests of this process."""
+
+    def __init__(self):
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self._views.setdefault(record['view'], ViewStats()).add(record)
+
+    def as_dict(self):
+        with self._lock:
+            return dict((view, stats.as_dict())
+                        for view, stats in self._views.items())
+
+    def clear(self):
+        with self._lock:
+            self._views = {}
+
+
+performance_stats = PerformanceStats()
+
+
+class PerformanceMiddleware(MiddlewareMixin):
+    """
+    Records, for a sample of requests, the view name, number of SQL queries,
+    SQL time, slowest statement, template render time and wall time, and
+    aggregates them per URL name. Configured by BLOG_PERFORMANCE:
+    ``sample_rate`` between 0 and 1 and ``server_timing`` to add a
+    Server-Timing header to sampled responses.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(PerformanceMiddleware, self).__init__(*args, **kwargs)
+        config = getattr(settings, 'BLOG_PERFORMANCE', {})
+        self.sample_rate = config.get('sample_rate', 0.0)
+        self.server_timing = config.get('server_timing', False)
+        template = django_backend.Template
+        if not getattr(template.render, 'timed', False):
+            template.render = _timed_render(template.render)
+
+    def process_request(self, request):
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return
+        request._perf = {'started': time.time(),
+                         'queries': len(connection.queries_log),
+                         'debug_cursor': connection.force_debug_cursor}
+        connection.force_debug_cursor = True
+        _local.template_time = 0.0
+
+    def process_response(self, request, response):
+        perf = getattr(request, '_perf', None)
+        if perf is None:
+            return response
+        total = (time.time() - perf['started']) * 1000
+        queries = list(connection.queries_log)[perf['queries']:]
+        connection.force_debug_cursor = perf['debug_cursor']
+        template_time = (_local.template_time or 0.0) * 1000
+        _local.template_time = None
+        times = [float(query['time']) * 1000 for query in queries]
+        slowest = None
+        if queries:
+            index = times.index(max(times))
+            slowest = {'sql': queries[index]['sql'], 'time': times[index]}
+        match = getattr(request, 'resolver_match', None)
+        record = {'view': match.url_name if match and match.url_name
+                  else 'unresolved',
+                  'queries': len(queries), 'sql_time': sum(times),
+                  'slowest': slowest, 'template_time': template_time,
+                  'total': total}
+        performance_stats.add(record)
+        if self.server_timing:
+            response['Server-Timing'] = \
+                'sql;dur=%.1f;desc="%d queries", tpl;dur=%.1f, ' \
+                'total;dur=%.1f' % (record['sql_time'], record['queries'],
+                                    template_time, total)
+        return response
+
+
+class ProfileMiddleware(MiddlewareMixin):
+    """
+    Sets ``request.profile`` to the CustomUser of ``request.user``, None
+    for anonymous users, resolved on first use. Must come after
+    AuthenticationMiddleware.
+    """
+
+    def process_request(self, request):
+        request.profile = SimpleLazyObject(lambda: load_profile(request.user))
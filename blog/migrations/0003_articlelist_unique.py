@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    ArticleList = apps.get_model('blog', 'ArticleList')
+    duplicates = ArticleList.objects.order_by().values('article', 'user')\
+        .annotate(first=Min('pk'), count=Count('pk')).filter(count__gt=1)
+    for row in duplicates:
+        ArticleList.objects.filter(article=row['article'], user=row['user'])\
+            .exclude(pk=row['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_auto_20161130_1323'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='articlelist',
+            unique_together=set([('article', 'user')]),
+        ),
+    ]
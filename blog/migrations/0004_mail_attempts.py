@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_articlelist_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mail',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Sending attempts'),
+        ),
+        migrations.AlterField(
+            model_name='mail',
+            name='status',
+            field=models.SmallIntegerField(choices=[(1, 'Queued'), (2, 'Sent'), (3, 'Retrying'), (4, 'Failed')], default=1, verbose_name='Sending status'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+CHUNK_SIZE = 1000
+
+
+def populate_timeline(apps, schema_editor):
+    ArticleList = apps.get_model('blog', 'ArticleList')
+    TimelineEntry = apps.get_model('blog', 'TimelineEntry')
+    rows = ArticleList.objects.filter(article__published=True,
+                                      article__published_date__isnull=False)\
+        .order_by('pk').values_list('user_id', 'article_id',
+                                    'article__published_date',
+                                    'article__slug', 'article__title',
+                                    'article__description')
+    entries = []
+    for user_id, article_id, published_date, slug, title, description \
+            in rows.iterator():
+        entries.append(TimelineEntry(user_id=user_id, article_id=article_id,
+                                     published_date=published_date,
+                                     slug=slug, title=title,
+                                     description=description))
+        if len(entries) >= CHUNK_SIZE:
+            TimelineEntry.objects.bulk_create(entries)
+            entries = []
+    TimelineEntry.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_mail_attempts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('published_date', models.DateTimeField(verbose_name='Published')),
+                ('slug', models.CharField(max_length=256, verbose_name='Slug')),
+                ('title', models.CharField(blank=True, max_length=256, verbose_name='Title')),
+                ('description', models.TextField(blank=True, verbose_name='Description')),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='blog.Article', verbose_name='Article')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='blog.CustomUser', verbose_name='Subscriber')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='timelineentry',
+            unique_together=set([('user', 'article')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='timelineentry',
+            index_together=set([('user', 'published_date')]),
+        ),
+        migrations.RunPython(populate_timeline, migrations.RunPython.noop),
+    ]
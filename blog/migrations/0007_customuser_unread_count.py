@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_unread(apps, schema_editor):
+    ArticleList = apps.get_model('blog', 'ArticleList')
+    CustomUser = apps.get_model('blog', 'CustomUser')
+    counts = ArticleList.objects.filter(read=False).order_by()\
+        .values_list('user').annotate(count=Count('pk'))
+    for user_id, count in counts:
+        CustomUser.objects.filter(pk=user_id).update(unread_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_searchposting'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Unread articles'),
+        ),
+        migrations.RunPython(count_unread, migrations.RunPython.noop),
+    ]
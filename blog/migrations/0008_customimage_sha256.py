@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+
+import blog.models
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def hash_images(apps, schema_editor):
+    CustomImage = apps.get_model('blog', 'CustomImage')
+    CustomUser = apps.get_model('blog', 'CustomUser')
+    first_by_digest = {}
+    for image in CustomImage.objects.order_by('pk'):
+        digest = hashlib.sha256()
+        try:
+            with default_storage.open(image.img.name, 'rb') as f:
+                for chunk in iter(lambda: f.read(64 * 1024), b''):
+                    digest.update(chunk)
+        except (IOError, OSError):
+            continue
+        digest = digest.hexdigest()
+        if digest in first_by_digest:
+            CustomUser.objects.filter(avatar=image)\
+                .update(avatar=first_by_digest[digest])
+            image.delete()
+        else:
+            first_by_digest[digest] = image.pk
+            CustomImage.objects.filter(pk=image.pk).update(sha256=digest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_customuser_unread_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customimage',
+            name='sha256',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='Content hash'),
+        ),
+        migrations.AddField(
+            model_name='customimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to=blog.models.get_thumbnail_path, verbose_name='Thumbnail'),
+        ),
+        migrations.RunPython(hash_images, migrations.RunPython.noop),
+    ]
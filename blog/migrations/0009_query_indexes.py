@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def deduplicate_slugs(apps, schema_editor):
+    Article = apps.get_model('blog', 'Article')
+    TimelineEntry = apps.get_model('blog', 'TimelineEntry')
+    duplicates = Article.objects.order_by().values('slug')\
+        .annotate(first=Min('pk'), count=Count('pk')).filter(count__gt=1)
+    for row in duplicates:
+        for pk in Article.objects.filter(slug=row['slug'])\
+                .exclude(pk=row['first']).values_list('pk', flat=True):
+            suffix = '-%d' % pk
+            slug = row['slug'][:256 - len(suffix)] + suffix
+            Article.objects.filter(pk=pk).update(slug=slug)
+            TimelineEntry.objects.filter(article_id=pk).update(slug=slug)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_customimage_sha256'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='article',
+            name='slug',
+            field=models.CharField(blank=True, max_length=256, unique=True, verbose_name='Slug'),
+        ),
+        migrations.AlterIndexTogether(
+            name='article',
+            index_together=set([('published', 'published_date'), ('blog', 'created')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='articlelist',
+            index_together=set([('user', 'read', 'article')]),
+        ),
+        # The auto-created through table only has the (blog, customuser)
+        # unique index; membership lookups go from the subscriber side.
+        # Lists of statements are run as they are, without sqlparse.
+        migrations.RunSQL(
+            ['CREATE INDEX blog_blog_subscribers_customuser_blog '
+             'ON blog_blog_subscribers (customuser_id, blog_id)'],
+            ['DROP INDEX blog_blog_subscribers_customuser_blog'],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.SmallIntegerField(choices=[(1, 'Pending'), (2, 'Claimed'), (3, 'Done'), (4, 'Failed')], default=1, verbose_name='Status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Attempts')),
+                ('claimed_by', models.CharField(blank=True, max_length=32, verbose_name='Claim token')),
+                ('claimed_at', models.DateTimeField(blank=True, null=True, verbose_name='Claimed')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('sent', models.PositiveIntegerField(default=0, verbose_name='Sent mails')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='Failed mails')),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='blog.Article', verbose_name='Article')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='notification',
+            index_together=set([('status', 'claimed_at')]),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+DIGEST_MESSAGE = '''New articles from the blogs you follow:
+{% for article_title, article_url in articles %}
+{{ article_title }}: {{ article_url }}{% endfor %}
+'''
+
+
+def create_digest_template(apps, schema_editor):
+    MailTemplate = apps.get_model('blog', 'MailTemplate')
+    if not MailTemplate.objects.filter(slug='digest').exists():
+        MailTemplate.objects.create(
+            name='Digest notification', slug='digest',
+            subject='{{ count }} new article{{ count|pluralize }}',
+            message=DIGEST_MESSAGE)
+
+
+def backfill_notified(apps, schema_editor):
+    # Rows from before notifications were tracked were mailed already.
+    ArticleList = apps.get_model('blog', 'ArticleList')
+    ArticleList.objects.filter(notified__isnull=True).update(notified=True)
+
+
+def delete_digest_template(apps, schema_editor):
+    MailTemplate = apps.get_model('blog', 'MailTemplate')
+    MailTemplate.objects.filter(slug='digest', default=False).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='digest',
+            field=models.PositiveIntegerField(blank=True, choices=[(0, 'Immediately'), (3600, 'Hourly digest'), (86400, 'Daily digest')], help_text='Left empty, the site default is used.', null=True, verbose_name='Notifications'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='last_digest_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Last digest'),
+        ),
+        migrations.RunPython(create_digest_template, delete_digest_template),
+        migrations.RunPython(backfill_notified, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='articlelist',
+            name='notified',
+            field=models.BooleanField(default=False, verbose_name='Is notified'),
+        ),
+    ]
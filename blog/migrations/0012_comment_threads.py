@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_comments(apps, schema_editor):
+    Article = apps.get_model('blog', 'Article')
+    ArticleComment = apps.get_model('blog', 'ArticleComment')
+    counts = ArticleComment.objects.order_by().values_list('article')\
+        .annotate(count=Count('pk'))
+    for article_id, count in counts:
+        Article.objects.filter(pk=article_id).update(comment_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_customuser_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Comments'),
+        ),
+        migrations.AlterField(
+            model_name='articlecomment',
+            name='ranking',
+            field=models.IntegerField(default=0, verbose_name="Comment's likes counting"),
+        ),
+        migrations.AlterIndexTogether(
+            name='articlecomment',
+            index_together=set([('article', 'ranking'), ('article', 'created')]),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+    ]
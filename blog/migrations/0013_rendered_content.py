@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def clear_excerpts(apps, schema_editor):
+    # Descriptions held everything after the first KB of the content; the
+    # render_articles command writes the bounded excerpts back.
+    TimelineEntry = apps.get_model('blog', 'TimelineEntry')
+    TimelineEntry.objects.update(excerpt='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_comment_threads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='content_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='Rendered content'),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=512, verbose_name='Excerpt'),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Words'),
+        ),
+        migrations.RenameField(
+            model_name='timelineentry',
+            old_name='description',
+            new_name='excerpt',
+        ),
+        migrations.RunPython(clear_excerpts, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='timelineentry',
+            name='excerpt',
+            field=models.CharField(blank=True, max_length=512, verbose_name='Excerpt'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0013_rendered_content'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_user', models.PositiveIntegerField(verbose_name='First recipient pk')),
+                ('last_user', models.PositiveIntegerField(verbose_name='Last recipient pk')),
+                ('recipients', models.PositiveIntegerField(verbose_name='Recipients')),
+                ('status', models.SmallIntegerField(choices=[(1, 'Pending'), (2, 'Sending'), (3, 'Done'), (4, 'Failed')], default=1, verbose_name='Status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Attempts')),
+                ('sent', models.PositiveIntegerField(default=0, verbose_name='Sent mails')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='Failed mails')),
+                ('error', models.TextField(blank=True, verbose_name='Last error')),
+                ('claimed_by', models.CharField(blank=True, max_length=32, verbose_name='Claim token')),
+                ('claimed_at', models.DateTimeField(blank=True, null=True, verbose_name='Claimed')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Updated')),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='blog.Notification', verbose_name='Notification')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='notificationchunk',
+            unique_together=set([('notification', 'first_user')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='notificationchunk',
+            index_together=set([('status', 'updated')]),
+        ),
+    ]
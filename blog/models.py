@@ -2,14 +2,16 @@ from __future__ import unicode_literals
 
 import re
 import os
-from datetime import datetime
-from django.db import models
+import uuid
+from django.db import models, transaction
 from django.conf import settings
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.files.base import ContentFile
-from tryit.celery import send_mail, add_log
+from blog.cache import article_cache
+from blog.rendering import render_article
 
 HTMLField = models.TextField
 if 'ckeditor' in settings.INSTALLED_APPS:
@@ -25,11 +27,36 @@ elif 'tinymce' in settings.INSTALLED_APPS:
 
 
 def clean_slug(pk, slug):
-    return '{0}-{1}'.format(pk, re.sub(r'[^0-9a-zA-Z._-]', '', slug))
+    slug = re.sub(r'[^0-9a-zA-Z._-]', '', slug)
+    prefix = '{0}-'.format(pk)
+    # Saving again keeps the slug.
+    return slug if slug.startswith(prefix) else prefix + slug
+
+
+def avatar_name(digest, ext=''):
+    return os.path.join(settings.AVATAR_DIR, digest[:2], digest + ext)
 
 
 def get_avatar_path(instance, filename):
-    return os.path.join(settings.MEDIA_ROOT, settings.AVATAR_DIR)
+    if instance.sha256:
+        return avatar_name(instance.sha256,
+                           os.path.splitext(filename)[1].lower())
+    return os.path.join(settings.AVATAR_DIR, filename)
+
+
+def get_thumbnail_path(instance, filename):
+    return os.path.join(settings.AVATAR_DIR, 'thumbs', filename)
+
+
+def drain_outbox():
+    # blog.tasks imports this module.
+    from blog.tasks import drain_outbox
+    drain_outbox.delay()
+
+
+def fan_out_article(article_pk):
+    from blog.tasks import fan_out_article
+    fan_out_article.delay(article_pk)
 
 
 def get_default_img():
@@ -39,10 +66,19 @@ def get_default_img():
 class CustomImage(models.Model):
     img = models.ImageField(verbose_name=_("Custom Image"),
                             upload_to=get_avatar_path)
+    sha256 = models.CharField(_("Content hash"), max_length=64, unique=True,
+                              null=True, blank=True)
+    thumbnail = models.ImageField(verbose_name=_("Thumbnail"),
+                                  upload_to=get_thumbnail_path, null=True,
+                                  blank=True)
 
     def __str__(self):
         return self.img.name
 
+    @property
+    def url(self):
+        return (self.thumbnail or self.img).url
+
 
 class CustomUser(models.Model):
     phone = models.CharField(verbose_name=_("Phone number"), max_length=32)
@@ -51,6 +87,19 @@ class CustomUser(models.Model):
     avatar = models.ForeignKey(CustomImage, verbose_name=_("User avatar"),
                                null=True, blank=True)
     user = models.OneToOneField(User)
+    unread_count = models.PositiveIntegerField(_("Unread articles"),
+                                               default=0)
+    IMMEDIATE, HOURLY, DAILY = 0, 60 * 60, 24 * 60 * 60
+    DIGESTS = (
+        (IMMEDIATE, _('Immediately')),
+        (HOURLY, _('Hourly digest')),
+        (DAILY, _('Daily digest')),
+    )
+    digest = models.PositiveIntegerField(
+        _("Notifications"), choices=DIGESTS, null=True, blank=True,
+        help_text=_('Left empty, the site default is used.'))
+    last_digest_at = models.DateTimeField(_("Last digest"), null=True,
+                                          blank=True)
 
     def __str__(self):
         return self.user.get_username()
@@ -90,10 +139,16 @@ class Category(models.Model):
 
 
 class Article(BaseDateTimeModel):
-    slug = models.CharField('Slug', max_length=256, blank=True, db_index=True)
+    slug = models.CharField('Slug', max_length=256, blank=True, unique=True)
     title = models.CharField('Title', max_length=256, blank=True)
     description = models.TextField('Description', max_length=1024, blank=True)
     content = models.TextField('Content', blank=True)
+    content_html = models.TextField('Rendered content', blank=True,
+                                    editable=False)
+    excerpt = models.CharField('Excerpt', max_length=512, blank=True,
+                               editable=False)
+    word_count = models.PositiveIntegerField('Words', default=0,
+                                             editable=False)
     published_date = models.DateTimeField('Published', blank=True, null=True)
     published = models.NullBooleanField('Is published')
     deleted = models.NullBooleanField('Is deleted')
@@ -101,11 +156,14 @@ class Article(BaseDateTimeModel):
     blog = models.ForeignKey(Blog, null=True, blank=True)
     # tag = models.ManyToManyField(Tag)
     category = models.ManyToManyField(Category, null=True, blank=True)
+    comment_count = models.PositiveIntegerField('Comments', default=0)
 
     class Meta:
         verbose_name = 'Article'
         verbose_name_plural = 'Articles'
         ordering = ['-created']
+        index_together = [('published', 'published_date'),
+                          ('blog', 'created')]
 
     def __str__(self):
         return self.name
@@ -120,21 +178,45 @@ class Article(BaseDateTimeModel):
         pk = self.blog.pk if self.blog else 1
         self.slug = clean_slug(pk, self.slug) if self.slug \
             else clean_slug(pk, self.name)
+        if Article.objects.filter(slug=self.slug).exclude(pk=self.pk)\
+                .exists():
+            self.slug = '%s-%s' % (self.slug[:247], uuid.uuid4().hex[:8])
         if not self.author_name:
             self.author_name = ' '.join([self.blog.author.user.first_name,
                                          self.blog.author.user.last_name])
         if not self.description:
-            self.description = self.content[1024:]
-        if self.is_published():
-            self.published_date = datetime.now()
-        super(Article, self).save(*args, **kwarg)
-        if self.is_published():
-            template = MailTemplate.objects.get(default=True)
-            message = '%s: and you can find the article ' \
-                      'here http://127.0.0.1%s' % (template.message,
-                                                   self.get_absolute_url())
-            send_mail(template.subject, message, template.from_addr,
-                      self.blog.subscribers.all())
+            self.description = self.content[:1024]
+        render_article(self)
+        counted = self.pk is not None
+        if counted:
+            # Comments are counted with UPDATEs, keep whatever they did.
+            self.comment_count = models.F('comment_count')
+        with transaction.atomic():
+            # Locked so that concurrent saves publish the article once.
+            stored = counted and Article.objects.select_for_update()\
+                .filter(pk=self.pk, published=True)\
+                .values(*TimelineEntry.fields_from(self)).first()
+            newly_published = self.is_published() and not stored
+            if newly_published:
+                self.published_date = timezone.now()
+            super(Article, self).save(*args, **kwarg)
+            if counted:
+                # Loaded again from the database on next access.
+                del self.comment_count
+            timeline_fields = TimelineEntry.fields_from(self)
+            if newly_published or self.is_published() and any(
+                    stored[name] != value
+                    for name, value in timeline_fields.items()):
+                TimelineEntry.objects.filter(article=self).update(
+                    **timeline_fields)
+            if newly_published:
+                # Subscribers are notified from the outbox once the article
+                # is committed, never when the transaction rolls back.
+                Notification.objects.create(article=self)
+                transaction.on_commit(drain_outbox)
+                pk = self.pk
+                transaction.on_commit(lambda: fan_out_article(pk))
+        article_cache.invalidate(self.slug)
 
     def get_absolute_url(self):
         return '/article/%s' % self.slug
@@ -144,19 +226,68 @@ class ArticleComment(BaseDateTimeModel):
     article = models.ForeignKey(Article)
     content = models.TextField('Content', blank=True)
     author = models.ForeignKey(CustomUser)
-    ranking = models.IntegerField(verbose_name=_("Comment's likes counting"))
+    ranking = models.IntegerField(verbose_name=_("Comment's likes counting"),
+                                  default=0)
+
+    class Meta:
+        index_together = [('article', 'ranking'), ('article', 'created')]
 
     def __str__(self):
         return "%s's comment for %s" % (self.author.user.get_username(),
                                         self.article.title)
 
+    def save(self, *args, **kwargs):
+        if not self.name:
+            self.name = uuid.uuid4().hex
+        super(ArticleComment, self).save(*args, **kwargs)
+
 
 class ArticleList(models.Model):
     read = models.BooleanField('Is read', default=False)
-    notified = models.NullBooleanField('Is notified', blank=True, null=True)
+    notified = models.BooleanField('Is notified', default=False)
     article = models.ForeignKey(Article, verbose_name='Article')
     user = models.ForeignKey(CustomUser, verbose_name='Subscriber')
 
+    class Meta:
+        unique_together = ('article', 'user')
+        index_together = [('user', 'read', 'article')]
+
+
+class TimelineEntry(models.Model):
+    """
+    Denormalized copy of the columns the feed renders, one row per published
+    article and subscriber.
+    """
+    user = models.ForeignKey(CustomUser, verbose_name='Subscriber')
+    article = models.ForeignKey(Article, verbose_name='Article')
+    published_date = models.DateTimeField('Published')
+    slug = models.CharField('Slug', max_length=256)
+    title = models.CharField('Title', max_length=256, blank=True)
+    excerpt = models.CharField('Excerpt', max_length=512, blank=True)
+
+    class Meta:
+        unique_together = ('user', 'article')
+        index_together = [('user', 'published_date')]
+
+    @staticmethod
+    def fields_from(article):
+        return {'published_date': article.published_date,
+                'slug': article.slug, 'title': article.title,
+                'excerpt': article.excerpt}
+
+
+class SearchPosting(models.Model):
+    """Inverted index entry: a term of a published article and its weight."""
+    term = models.CharField('Term', max_length=64)
+    article = models.ForeignKey(Article, verbose_name='Article')
+    blog = models.ForeignKey(Blog, verbose_name='Blog', null=True,
+                             blank=True)
+    weight = models.PositiveIntegerField('Weight')
+
+    class Meta:
+        unique_together = ('term', 'article')
+        index_together = [('term', 'weight')]
+
 
 class MailTemplate(BaseDateTimeModel):
     subject = models.CharField('Subject', max_length=128)
@@ -180,20 +311,95 @@ class MailTemplate(BaseDateTimeModel):
     def __str__(self):
         return self.name
 
-    def get_template(self, slug=None):
-        if self.objects.filter(slug=slug).exists():
-            template = self.objects.filter(slug=slug)
-        else:
-            template = self.objects.filter(default=True)[0]
-        return template
+    @classmethod
+    def get_template(cls, slug=None):
+        template = cls.objects.filter(slug=slug).first() if slug else None
+        return template or cls.objects.get(default=True)
 
     def is_default(self):
         return self.default
 
 
 class Mail(BaseDateTimeModel):
+    QUEUED, SENT, RETRYING, FAILED = 1, 2, 3, 4
+    STATUSES = (
+        (QUEUED, _('Queued')),
+        (SENT, _('Sent')),
+        (RETRYING, _('Retrying')),
+        (FAILED, _('Failed')),
+    )
+
     sended = models.NullBooleanField('Is sent')
-    status = models.SmallIntegerField('Sending status', default=1)
+    status = models.SmallIntegerField('Sending status', default=QUEUED,
+                                      choices=STATUSES)
+    attempts = models.PositiveSmallIntegerField('Sending attempts',
+                                                default=0)
     to_addr = models.EmailField('Subscriber email address')
     sending_date = models.DateTimeField('Date of sending', null=True,
                                         blank=True)
+
+
+class Notification(models.Model):
+    """
+    Outbox entry written in the transaction publishing an article. Workers
+    claim entries with a conditional UPDATE and split the subscribers into
+    NotificationChunks; a claim older than the lease is considered
+    abandoned and taken over, which queues the unfinished chunks again.
+    The entry is done once all its chunks are. ``sent`` and ``failed`` add
+    up the chunks.
+    """
+    PENDING, CLAIMED, DONE, FAILED = 1, 2, 3, 4
+    STATUSES = (
+        (PENDING, _('Pending')),
+        (CLAIMED, _('Claimed')),
+        (DONE, _('Done')),
+        (FAILED, _('Failed')),
+    )
+
+    article = models.ForeignKey(Article, verbose_name='Article')
+    status = models.SmallIntegerField('Status', default=PENDING,
+                                      choices=STATUSES)
+    attempts = models.PositiveSmallIntegerField('Attempts', default=0)
+    claimed_by = models.CharField('Claim token', max_length=32, blank=True)
+    claimed_at = models.DateTimeField('Claimed', null=True, blank=True)
+    created = models.DateTimeField('Created', auto_now_add=True)
+    sent = models.PositiveIntegerField('Sent mails', default=0)
+    failed = models.PositiveIntegerField('Failed mails', default=0)
+
+    class Meta:
+        index_together = [('status', 'claimed_at')]
+
+
+class NotificationChunk(models.Model):
+    """
+    Subscribers of a notification whose CustomUser pk is between
+    ``first_user`` and ``last_user``, mailed by one task. The task claims
+    the chunk with a conditional UPDATE stamping a fresh token before
+    sending; a claim older than the lease is considered abandoned.
+    """
+    PENDING, SENDING, DONE, FAILED = 1, 2, 3, 4
+    STATUSES = (
+        (PENDING, _('Pending')),
+        (SENDING, _('Sending')),
+        (DONE, _('Done')),
+        (FAILED, _('Failed')),
+    )
+
+    notification = models.ForeignKey(Notification, related_name='chunks',
+                                     verbose_name='Notification')
+    first_user = models.PositiveIntegerField('First recipient pk')
+    last_user = models.PositiveIntegerField('Last recipient pk')
+    recipients = models.PositiveIntegerField('Recipients')
+    status = models.SmallIntegerField('Status', default=PENDING,
+                                      choices=STATUSES)
+    attempts = models.PositiveSmallIntegerField('Attempts', default=0)
+    sent = models.PositiveIntegerField('Sent mails', default=0)
+    failed = models.PositiveIntegerField('Failed mails', default=0)
+    error = models.TextField('Last error', blank=True)
+    claimed_by = models.CharField('Claim token', max_length=32, blank=True)
+    claimed_at = models.DateTimeField('Claimed', null=True, blank=True)
+    updated = models.DateTimeField('Updated', auto_now=True)
+
+    class Meta:
+        unique_together = [('notification', 'first_user')]
+        index_together = [('status', 'updated')]
@@ -0,0 +1,97 @@
+import logging
+import time
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from blog.dispatch import complete, dispatch
+from blog.models import Notification
+
+logger = logging.getLogger(__name__)
+
+DrainResult = namedtuple('DrainResult', ['notifications', 'chunks',
+                                         'recipients', 'errors', 'elapsed'])
+
+
+class Outbox(object):
+    """
+    Drains the Notification outbox. Every batch is claimed with one
+    conditional UPDATE stamping a fresh token, so concurrent workers never
+    get the same entry. An entry whose claim is older than ``lease``
+    seconds is claimed again; after ``max_attempts`` claims it is failed.
+    Processing an entry queues the chunk tasks mailing its recipients. The
+    entry stays claimed until its last chunk is done, so chunks that
+    failed all their retries or whose worker died are queued again once
+    the lease expires.
+    """
+
+    def __init__(self, batch_size=20, lease=600, max_attempts=5):
+        self.batch_size = batch_size
+        self.lease = lease
+        self.max_attempts = max_attempts
+
+    @classmethod
+    def from_settings(cls):
+        return cls(**getattr(settings, 'BLOG_OUTBOX', {}))
+
+    def _claimable(self, now):
+        return Q(status=Notification.PENDING) | Q(
+            status=Notification.CLAIMED,
+            claimed_at__lt=now - timedelta(seconds=self.lease))
+
+    def claim(self):
+        now = timezone.now()
+        claimable = self._claimable(now)
+        Notification.objects.filter(claimable,
+                                    attempts__gte=self.max_attempts)\
+            .update(status=Notification.FAILED, claimed_by='')
+        pks = list(Notification.objects.filter(claimable)
+                   .order_by('pk').values_list('pk', flat=True)
+                   [:self.batch_size])
+        if not pks:
+            return []
+        token = uuid.uuid4().hex
+        # Rows claimed by another worker since the SELECT no longer match.
+        Notification.objects.filter(claimable, pk__in=pks).update(
+            status=Notification.CLAIMED, claimed_by=token, claimed_at=now,
+            attempts=F('attempts') + 1)
+        return list(Notification.objects.filter(claimed_by=token)
+                    .select_related('article__blog').order_by('pk'))
+
+    def process(self, notification):
+        return dispatch(notification)
+
+    def _release(self, notification):
+        Notification.objects.filter(pk=notification.pk,
+                                    claimed_by=notification.claimed_by)\
+            .update(status=Notification.PENDING, claimed_by='')
+
+    def drain(self, max_batches=None):
+        started = time.time()
+        count = chunks = recipients = errors = batches = 0
+        while max_batches is None or batches < max_batches:
+            notifications = self.claim()
+            if not notifications:
+                break
+            batches += 1
+            for notification in notifications:
+                try:
+                    result = self.process(notification)
+                except Exception:
+                    logger.exception('Notification %d failed', notification.pk)
+                    errors += 1
+                    self._release(notification)
+                    continue
+                complete(notification.pk)
+                count += 1
+                chunks += result.chunks
+                recipients += result.recipients
+        return DrainResult(count, chunks, recipients, errors,
+                           time.time() - started)
+
+
+outbox = SimpleLazyObject(Outbox.from_settings)
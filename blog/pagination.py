@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404
+from django.utils import timezone
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def encode_cursor(value, pk):
+    if timezone.is_aware(value):
+        value = timezone.make_naive(value, timezone.utc)
+    delta = value - EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 10 ** 6 + \
+        delta.microseconds
+    return '%d-%d' % (micros, pk)
+
+
+def decode_cursor(cursor):
+    try:
+        micros, pk = cursor.rsplit('-', 1)
+        value = EPOCH + timedelta(microseconds=int(micros))
+        pk = int(pk)
+    except (ValueError, OverflowError):
+        raise Http404('Invalid page cursor')
+    if settings.USE_TZ:
+        value = timezone.make_aware(value, timezone.utc)
+    return value, pk
+
+
+class KeysetPage(object):
+
+    def __init__(self, object_list, field, has_next, has_previous):
+        self.object_list = object_list
+        self.field = field
+        self.has_next = has_next and bool(object_list)
+        self.has_previous = has_previous and bool(object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _cursor(self, obj):
+        return encode_cursor(getattr(obj, self.field), obj.pk)
+
+    @property
+    def next_cursor(self):
+        return self._cursor(self.object_list[-1]) if self.has_next else None
+
+    @property
+    def previous_cursor(self):
+        return self._cursor(self.object_list[0]) if self.has_previous \
+            else None
+
+
+class KeysetPaginator(object):
+    """
+    Paginates a queryset newest first on (field, pk) without COUNT or
+    OFFSET: every page is a range scan starting at the cursor and reading
+    one row more than it shows to find out whether another page follows.
+    """
+
+    def __init__(self, queryset, field='published_date', per_page=None):
+        self.queryset = queryset.filter(**{field + '__isnull': False})
+        self.field = field
+        self.per_page = per_page or getattr(settings, 'BLOG_PAGE_SIZE', 20)
+
+    def page(self, before=None, after=None):
+        field = self.field
+        if after:
+            value, pk = decode_cursor(after)
+            rows = list(self.queryset
+                        .filter(Q(**{field + '__gt': value}) |
+                                Q(**{field: value, 'pk__gt': pk}))
+                        .order_by(field, 'pk')[:self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            rows.reverse()
+            return KeysetPage(rows, field, True, has_previous)
+        queryset = self.queryset
+        if before:
+            value, pk = decode_cursor(before)
+            queryset = queryset.filter(Q(**{field + '__lt': value}) |
+                                       Q(**{field: value, 'pk__lt': pk}))
+        rows = list(queryset.order_by('-' + field,
+                                      '-pk')[:self.per_page + 1])
+        return KeysetPage(rows[:self.per_page], field,
+                          len(rows) > self.per_page, bool(before))
+
+
+def paginate(request, queryset, field='published_date'):
+    return KeysetPaginator(queryset, field).page(
+        before=request.GET.get('before'), after=request.GET.get('after'))
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.cache import cache
+from blog.models import CustomUser
+
+PROFILE_KEY = 'profile:%s'
+# Updated behind the profile's back by queryset UPDATEs, so never cached:
+# read on access, and left out when a loaded profile is saved.
+VOLATILE_FIELDS = ('unread_count', 'last_digest_at')
+
+
+def get_timeout():
+    return getattr(settings, 'BLOG_PROFILE_CACHE_TIMEOUT', 15 * 60)
+
+
+def load_profile(user):
+    """
+    CustomUser of the auth user, with its avatar, or None. A miss is
+    loaded with one query and kept in the cache until the profile, its
+    user or its avatar is saved or deleted; the cache must be shared by
+    all processes for that to reach them, see CACHES. The user itself is
+    not cached: the request already holds a fresh copy, which is attached
+    instead.
+    """
+    if user is None or not user.is_authenticated():
+        return None
+    key = PROFILE_KEY % user.pk
+    profile = cache.get(key)
+    if profile is None:
+        profile = CustomUser.objects.select_related('avatar')\
+            .defer(*VOLATILE_FIELDS).filter(user_id=user.pk).first()
+        if profile is None:
+            return None
+        cache.set(key, profile, get_timeout())
+    profile.user = user
+    return profile
+
+
+def invalidate_profiles(*user_pks):
+    cache.delete_many([PROFILE_KEY % pk for pk in user_pks])
@@ -0,0 +1,136 @@
+import re
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.core.urlresolvers import reverse
+from django.db.backends.utils import CursorWrapper
+
+Finding = namedtuple('Finding', ['url', 'kind', 'table', 'rows', 'sql',
+                                 'plan'])
+
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+SQLITE_TABLE = re.compile(r'^(?:SCAN|SEARCH) (?:TABLE )?(\w+)')
+SQLITE_SORT = re.compile(
+    r'^USE TEMP B-TREE FOR (?:(?:ORDER|GROUP) BY|DISTINCT)')
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+POSTGRES_SORT = re.compile(r'(?:^|-> +)Sort +\(cost=\S+ rows=(\d+)')
+
+
+def hot_urls(slug=None):
+    """The pages audited by default, as seen by a logged in reader."""
+    urls = [reverse(name) for name in ('articles-get', 'articles-get-user',
+                                       'blog-subscribe', 'feed')]
+    urls.append(reverse('article-search') + '?q=lorem')
+    if slug:
+        urls.append(reverse('article-get', args=[slug]))
+    return urls
+
+
+class RecordingCursor(CursorWrapper):
+    """Cursor keeping the statements it runs with their parameters."""
+
+    def __init__(self, cursor, db, statements):
+        super(RecordingCursor, self).__init__(cursor, db)
+        self.statements = statements
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+        return super(RecordingCursor, self).execute(sql, params)
+
+
+@contextmanager
+def capture_statements(connection):
+    """
+    Collects the (sql, params) pairs run on ``connection``. Unlike
+    CaptureQueriesContext the parameters stay apart from the statement, so
+    it can be explained again on any backend.
+    """
+    statements = []
+    forced = connection.force_debug_cursor
+    connection.make_debug_cursor = \
+        lambda cursor: RecordingCursor(cursor, connection, statements)
+    connection.force_debug_cursor = True
+    try:
+        yield statements
+    finally:
+        connection.force_debug_cursor = forced
+        del connection.make_debug_cursor
+
+
+class PlanAuditor(object):
+    """
+    Explains captured SELECT statements and reports the sequential scans
+    and sorts touching tables of at least ``min_rows`` rows. SQLite and
+    PostgreSQL plans are understood.
+    """
+
+    def __init__(self, connection, min_rows=1000):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise ValueError('No plan parser for %s' % connection.vendor)
+        self.connection = connection
+        self.min_rows = min_rows
+        self._sizes = {}
+        self._tables = set(connection.introspection.table_names())
+
+    def size(self, table):
+        if table not in self._tables:
+            return 0
+        if table not in self._sizes:
+            with self.connection.cursor() as cursor:
+                cursor.execute('SELECT COUNT(*) FROM %s'
+                               % self.connection.ops.quote_name(table))
+                self._sizes[table] = cursor.fetchone()[0]
+        return self._sizes[table]
+
+    def explain(self, sql, params):
+        prefix = 'EXPLAIN QUERY PLAN ' \
+            if self.connection.vendor == 'sqlite' else 'EXPLAIN '
+        with self.connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def _sqlite_findings(self, plan):
+        tables = [match.group(1) for match in map(SQLITE_TABLE.match, plan)
+                  if match]
+        for line in plan:
+            match = SQLITE_SCAN.match(line)
+            if match:
+                yield 'seq_scan', match.group(1), self.size(match.group(1))
+            elif SQLITE_SORT.match(line) and tables:
+                table = max(tables, key=self.size)
+                yield 'sort', table, self.size(table)
+
+    def _postgresql_findings(self, plan):
+        for line in plan:
+            match = POSTGRES_SCAN.search(line)
+            if match:
+                yield 'seq_scan', match.group(1), self.size(match.group(1))
+            match = POSTGRES_SORT.search(line)
+            if match:
+                yield 'sort', None, int(match.group(1))
+
+    def audit(self, statements, url=None):
+        findings, seen = [], set()
+        parse = getattr(self, '_%s_findings' % self.connection.vendor)
+        for sql, params in statements:
+            if sql in seen or not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            seen.add(sql)
+            plan = self.explain(sql, params)
+            for kind, table, rows in parse(plan):
+                if rows >= self.min_rows:
+                    findings.append(Finding(url, kind, table, rows, sql,
+                                            '\n'.join(plan)))
+        return findings
+
+    def audit_urls(self, client, urls):
+        """Requests every url with ``client`` and audits what it ran."""
+        findings = []
+        for url in urls:
+            with capture_statements(self.connection) as statements:
+                response = client.get(url)
+            if response.status_code != 200:
+                raise ValueError('%s answered %d'
+                                 % (url, response.status_code))
+            findings.extend(self.audit(statements, url))
+        return findings
@@ -0,0 +1,38 @@
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Q
+from blog.counters import add_unread
+from blog.fanout import chunked
+from blog.models import ArticleList
+
+
+def write_receipts(receipts, batch_size=500):
+    """
+    Marks the ArticleList rows of (auth user id, article id) pairs as read,
+    one UPDATE per batch, and takes them off the unread counters. Rows
+    already read are left alone, so writing a receipt twice is harmless.
+    """
+    updated = 0
+    for batch in chunked(receipts, batch_size):
+        condition = reduce(or_, (Q(user__user_id=user_id,
+                                   article_id=article_id)
+                                 for user_id, article_id in batch))
+        with transaction.atomic():
+            rows = list(ArticleList.objects.select_for_update()
+                        .filter(condition, read=False)
+                        .values_list('pk', 'user_id', 'article__published'))
+            if not rows:
+                continue
+            ArticleList.objects.filter(pk__in=[pk for pk, _, _ in rows])\
+                .update(read=True)
+            # Rows of drafts were never counted.
+            deltas = Counter()
+            for _, user_id, published in rows:
+                if published:
+                    deltas[user_id] -= 1
+            add_unread(deltas)
+        updated += len(rows)
+    return updated
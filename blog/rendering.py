@@ -0,0 +1,131 @@
+import re
+
+from django.utils.html import escape, linebreaks, strip_tags
+from django.utils.six.moves.html_parser import HTMLParser
+from django.utils.text import Truncator
+
+try:
+    from html import unescape
+except ImportError:  # Python 2
+    unescape = HTMLParser().unescape
+
+EXCERPT_LENGTH = 300
+
+ALLOWED_TAGS = {
+    'a': ('href', 'title'), 'b': (), 'blockquote': (), 'br': (),
+    'code': (), 'em': (), 'h2': (), 'h3': (), 'h4': (), 'hr': (), 'i': (),
+    'img': ('src', 'alt', 'title'), 'li': (), 'ol': (), 'p': (), 'pre': (),
+    'strong': (), 'ul': (),
+}
+VOID_TAGS = ('br', 'hr', 'img')
+BLOCK_TAGS = ('blockquote', 'h2', 'h3', 'h4', 'ol', 'p', 'pre', 'ul')
+DROPPED_TAGS = ('script', 'style')
+URL_ATTRIBUTES = ('href', 'src')
+SAFE_SCHEMES = ('http', 'https', 'mailto')
+# Browsers drop ASCII whitespace and control characters anywhere in a URL
+# before reading its scheme, "java\tscript:" is "javascript:".
+IGNORED_URL_CHARACTERS = re.compile(r'[\x00-\x20\x7f]+')
+# Block ends separate words once the tags are stripped.
+BLOCK_END = re.compile(r'</(?:%s|li)>|<br\s*/?>' % '|'.join(BLOCK_TAGS))
+
+
+def is_safe_url(url):
+    """
+    Whether the URL is relative or uses one of the SAFE_SCHEMES, once its
+    entities are decoded and the characters browsers ignore removed.
+    """
+    url = IGNORED_URL_CHARACTERS.sub('', unescape(url))
+    scheme, colon, _ = url.partition(':')
+    if not colon or '/' in scheme or '?' in scheme or '#' in scheme:
+        return True
+    return scheme.lower() in SAFE_SCHEMES
+
+
+class Sanitizer(HTMLParser):
+    """
+    Rebuilds the markup keeping only the allowed tags and attributes and
+    escaping everything else. Script and style contents are dropped, open
+    tags are closed.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.output = []
+        self.open_tags = []
+        self.dropping = 0
+        self.has_blocks = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_TAGS:
+            self.dropping += 1
+        if self.dropping or tag not in ALLOWED_TAGS:
+            return
+        kept = ''.join(' %s="%s"' % (name, escape(value))
+                       for name, value in attrs
+                       if name in ALLOWED_TAGS[tag] and value is not None and
+                       (name not in URL_ATTRIBUTES or is_safe_url(value)))
+        self.output.append('<%s%s>' % (tag, kept))
+        self.has_blocks = self.has_blocks or tag in BLOCK_TAGS
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        # <script/> has no contents to drop and no end tag to stop at.
+        if tag in DROPPED_TAGS:
+            return
+        self.handle_starttag(tag, attrs)
+        if tag in self.open_tags[-1:] and tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_TAGS:
+            self.dropping = max(self.dropping - 1, 0)
+            return
+        if self.dropping or tag not in self.open_tags:
+            return
+        while self.open_tags:
+            closed = self.open_tags.pop()
+            self.output.append('</%s>' % closed)
+            if closed == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.output.append(escape(data))
+
+    def handle_entityref(self, name):
+        self.handle_data(unescape('&%s;' % name))
+
+    def handle_charref(self, name):
+        self.handle_data(unescape('&#%s;' % name))
+
+    def close(self):
+        HTMLParser.close(self)
+        while self.open_tags:
+            self.output.append('</%s>' % self.open_tags.pop())
+        return ''.join(self.output)
+
+
+def render_content(content):
+    """Sanitized HTML of the content, paragraphs added to plain text."""
+    sanitizer = Sanitizer()
+    sanitizer.feed(content or '')
+    html = sanitizer.close()
+    if not sanitizer.has_blocks:
+        html = linebreaks(html)
+    return html
+
+
+def plain_text(html):
+    return ' '.join(unescape(strip_tags(BLOCK_END.sub(' ', html))).split())
+
+
+def render_article(article):
+    """Fills the stored HTML, excerpt and word count of the article."""
+    article.content_html = render_content(article.content)
+    text = plain_text(article.content_html)
+    article.word_count = len(text.split())
+    source = plain_text(article.description) if article.description \
+        else text
+    article.excerpt = Truncator(source).chars(EXCERPT_LENGTH)
+    return article
@@ -0,0 +1,122 @@
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404
+from blog.models import Article, SearchPosting
+
+TOKEN_RE = re.compile(r'\w+', re.U)
+STOP_WORDS = frozenset('a an and are as at be by for from has have in is it '
+                       'its of on or that the this to was were will with'
+                       .split())
+FIELD_WEIGHTS = (('title', 3), ('description', 2), ('content', 1))
+MAX_TERM_LENGTH = 64
+
+
+def tokenize(text):
+    for token in TOKEN_RE.findall(text.lower()):
+        if len(token) > 1 and token not in STOP_WORDS:
+            yield token[:MAX_TERM_LENGTH]
+
+
+def postings_for(article):
+    weights = defaultdict(int)
+    for field, weight in FIELD_WEIGHTS:
+        for term in tokenize(getattr(article, field) or ''):
+            weights[term] += weight
+    return [SearchPosting(term=term, article_id=article.pk,
+                          blog_id=article.blog_id, weight=weight)
+            for term, weight in weights.items()]
+
+
+def is_indexable(article):
+    return bool(article.published) and not article.deleted
+
+
+def index_article(article):
+    """Replaces the postings of the article with its current terms."""
+    with transaction.atomic():
+        SearchPosting.objects.filter(article_id=article.pk).delete()
+        if is_indexable(article):
+            SearchPosting.objects.bulk_create(postings_for(article))
+
+
+class SearchPage(object):
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.has_next = next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _decode_cursor(cursor):
+    try:
+        score, pk = cursor.split('-')
+        return int(score), int(pk)
+    except ValueError:
+        raise Http404('Invalid page cursor')
+
+
+def get_candidate_limit():
+    return getattr(settings, 'BLOG_SEARCH_CANDIDATES', 500)
+
+
+def search(query, category=None, blog=None, after=None, per_page=None,
+           candidates=None):
+    """
+    Returns the published articles containing every term of the query,
+    best ranked first. The rank is the summed weight of the matched terms;
+    pages follow each other on (rank, article id).
+
+    Only the ``candidates`` newest articles holding the rarest term are
+    ranked: the other terms are looked up for those articles alone, so a
+    query reads a bounded number of postings however common its terms.
+    """
+    per_page = per_page or getattr(settings, 'BLOG_PAGE_SIZE', 20)
+    limit = candidates or get_candidate_limit()
+    terms = sorted(set(tokenize(query)))
+    if not terms:
+        return SearchPage([], None)
+    postings = SearchPosting.objects.all()
+    if blog:
+        postings = postings.filter(blog_id=blog)
+    if category:
+        postings = postings.filter(article__category=category)
+    # Counting stops one posting past the limit.
+    terms.sort(key=lambda term: postings.filter(term=term)[:limit + 1]
+               .count())
+    scores = dict(postings.filter(term=terms[0]).order_by('-article_id')
+                  .values_list('article_id', 'weight')[:limit])
+    for term in terms[1:]:
+        if not scores:
+            break
+        found = dict(SearchPosting.objects
+                     .filter(term=term, article_id__in=list(scores))
+                     .values_list('article_id', 'weight'))
+        scores = dict((pk, score + found[pk])
+                      for pk, score in scores.items() if pk in found)
+    ranked = sorted(((score, pk) for pk, score in scores.items()),
+                    reverse=True)
+    if after:
+        cursor = _decode_cursor(after)
+        ranked = [row for row in ranked if row < cursor]
+    next_cursor = None
+    if len(ranked) > per_page:
+        ranked = ranked[:per_page]
+        next_cursor = '%d-%d' % ranked[-1]
+    articles = Article.objects.only('slug', 'title', 'excerpt')\
+        .in_bulk([pk for _, pk in ranked])
+    results = []
+    for score, pk in ranked:
+        article = articles.get(pk)
+        if article is not None:
+            article.score = score
+            results.append(article)
+    return SearchPage(results, next_cursor)
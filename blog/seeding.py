@@ -0,0 +1,264 @@
+import random
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+from blog.fanout import chunked
+from blog.models import Article, ArticleList, Blog, Category, CustomUser, \
+    TimelineEntry, clean_slug
+from blog.rendering import render_article
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do '
+         'eiusmod tempor incididunt ut labore et dolore magna aliqua enim '
+         'minim veniam quis nostrud exercitation ullamco laboris nisi aliquip '
+         'commodo consequat duis aute irure reprehenderit voluptate velit '
+         'esse cillum fugiat nulla pariatur excepteur sint occaecat').split()
+
+
+def zipf_cumulative(size, exponent):
+    """Cumulative weights making rank r about r**exponent times rarer."""
+    total, cumulative = 0.0, []
+    for rank in range(1, size + 1):
+        total += 1.0 / rank ** exponent
+        cumulative.append(total)
+    return cumulative
+
+
+class Seeder(object):
+    """
+    Generates a reproducible synthetic dataset through chunked bulk inserts.
+
+    Nothing goes through Article.save, so no mail, fan-out task or signal
+    is triggered; content is rendered as save would. Blog popularity and
+    sizes follow a Zipf distribution: a few blogs get most subscribers and
+    articles. ArticleList and timeline rows are derived from subscriptions
+    with INSERT ... SELECT statements per chunk of seeded users, so memory
+    stays bounded by the chunk size. Rows of a chunk are looked up by name
+    afterwards, so on SQLite the chunk size must stay below its limit of
+    999 query parameters.
+    """
+
+    def __init__(self, users=10000, blogs=100, articles=100000,
+                 categories=20, subscriptions=5, zipf=1.1, prefix='seed',
+                 seed=0, chunk_size=500, stdout=None):
+        self.users = users
+        self.blogs = min(blogs, users)
+        self.articles = articles
+        self.categories = categories
+        self.subscriptions = subscriptions
+        self.prefix = prefix
+        self.rng = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.stdout = stdout
+        self.cumulative = zipf_cumulative(self.blogs, zipf)
+        self.counts = OrderedDict()
+        self.timings = OrderedDict()
+
+    def _count(self, table, rows, started):
+        self.counts[table] = self.counts.get(table, 0) + rows
+        self.timings[table] = self.timings.get(table, 0.0) + \
+            time.time() - started
+
+    def _log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def _pick_blog(self):
+        point = self.rng.random() * self.cumulative[-1]
+        return self.blog_ids[bisect_left(self.cumulative, point)]
+
+    def _words(self, count):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(count))
+
+    def run(self):
+        started = time.time()
+        self.seed_users()
+        self.seed_blogs()
+        self.seed_categories()
+        self.seed_articles()
+        self.seed_subscriptions()
+        self.elapsed = time.time() - started
+        return self.counts
+
+    def seed_users(self):
+        password = make_password('secret')
+        self.author_ids = []
+        self.user_ids = []
+        for chunk in chunked(range(self.users), self.chunk_size):
+            started = time.time()
+            names = ['%s-%d' % (self.prefix, i) for i in chunk]
+            with transaction.atomic():
+                User.objects.bulk_create([
+                    User(username=name, password=password,
+                         email='%s@example.com' % name,
+                         first_name=name, last_name=self.prefix)
+                    for name in names])
+                user_ids = list(User.objects.filter(username__in=names)
+                                .values_list('pk', flat=True))
+                CustomUser.objects.bulk_create([
+                    CustomUser(user_id=pk, phone='0') for pk in user_ids])
+                pks = sorted(CustomUser.objects.filter(user_id__in=user_ids)
+                             .values_list('pk', flat=True))
+            self._count('user', len(names) * 2, started)
+            self.user_ids.extend(pks)
+            missing = self.blogs - len(self.author_ids)
+            if missing > 0:
+                self.author_ids.extend(pks[:missing])
+        self._log('users: %d' % self.users)
+
+    def seed_blogs(self):
+        started = time.time()
+        self.blog_ids = []
+        names = ('%s blog %d' % (self.prefix, i)
+                 for i in range(len(self.author_ids)))
+        for chunk in chunked(zip(names, self.author_ids), self.chunk_size):
+            Blog.objects.bulk_create([Blog(name=name, author_id=author_id)
+                                      for name, author_id in chunk])
+            self.blog_ids.extend(
+                Blog.objects.filter(name__in=[name for name, _ in chunk])
+                .order_by('pk').values_list('pk', flat=True))
+        self._count('blog', len(self.blog_ids), started)
+        self._log('blogs: %d' % len(self.blog_ids))
+
+    def seed_categories(self):
+        started = time.time()
+        names = ['%s category %d' % (self.prefix, i)
+                 for i in range(self.categories)]
+        Category.objects.bulk_create([Category(name=name) for name in names])
+        self.category_ids = []
+        for chunk in chunked(names, self.chunk_size):
+            self.category_ids.extend(Category.objects.filter(name__in=chunk)
+                                     .values_list('pk', flat=True))
+        self._count('category', len(names), started)
+
+    def seed_articles(self):
+        now = timezone.now()
+        Link = Article.category.through
+        for chunk in chunked(range(self.articles), self.chunk_size):
+            started = time.time()
+            articles = []
+            for i in chunk:
+                blog_id = self._pick_blog()
+                name = '%s article %d' % (self.prefix, i)
+                articles.append(render_article(Article(
+                    name=name, slug=clean_slug(blog_id, name),
+                    title=self._words(6).capitalize(),
+                    description=self._words(30),
+                    content=self._words(self.rng.randint(100, 1000)),
+                    published=True, blog_id=blog_id,
+                    author_name=self.prefix,
+                    published_date=now - timedelta(
+                        seconds=self.rng.randint(0, 365 * 24 * 3600)))))
+            with transaction.atomic():
+                Article.objects.bulk_create(articles)
+                article_ids = Article.objects.filter(
+                    name__in=[article.name for article in articles])\
+                    .values_list('pk', flat=True)
+                links = []
+                if self.category_ids:
+                    for article_id in article_ids:
+                        for category_id in set(
+                                self.rng.choice(self.category_ids)
+                                for _ in range(self.rng.randint(0, 2))):
+                            links.append(Link(article_id=article_id,
+                                              category_id=category_id))
+                    Link.objects.bulk_create(links)
+            self._count('article', len(articles), started)
+            self._count('article_category', len(links), started)
+        self._log('articles: %d' % self.articles)
+
+    def _subscriptions_of(self, user_id):
+        if self.subscriptions <= 0:
+            return set()
+        wanted = min(self.blogs, max(1, int(self.rng.expovariate(
+            1.0 / self.subscriptions))))
+        blog_ids = set()
+        for _ in range(wanted * 4):
+            blog_ids.add(self._pick_blog())
+            if len(blog_ids) >= wanted:
+                break
+        return blog_ids
+
+    def seed_subscriptions(self):
+        Through = Blog.subscribers.through
+        for chunk in chunked(sorted(self.user_ids), self.chunk_size):
+            started = time.time()
+            rows = [Through(blog_id=blog_id, customuser_id=user_id)
+                    for user_id in chunk
+                    for blog_id in self._subscriptions_of(user_id)]
+            with transaction.atomic():
+                Through.objects.bulk_create(rows)
+            self._count('subscription', len(rows), started)
+            self.fan_out(chunk[0], chunk[-1] + 1)
+        self._log('subscriptions: %d' % self.counts.get('subscription', 0))
+
+    def _table(self, model):
+        return connection.ops.quote_name(model._meta.db_table)
+
+    def fan_out(self, start, end):
+        """
+        Derives ArticleList, timeline and unread counters for the seeded
+        users with a pk in the range; users created otherwise in between
+        are left alone.
+        """
+        qn = connection.ops.quote_name
+        subscribers = self._table(Blog.subscribers.through)
+        articles = self._table(Article)
+        seeded, seeded_params = CustomUser.objects.filter(
+            pk__gte=start, pk__lt=end, user__last_name=self.prefix)\
+            .values('pk').query.sql_with_params()
+        statements = (
+            # Seeded readers are never mailed about seeded articles.
+            ('article_list',
+             'INSERT INTO %s (%s, %s, %s, %s) SELECT %%s, %%s, a.%s, s.%s '
+             'FROM %s a INNER JOIN %s s ON s.%s = a.%s '
+             'WHERE s.%s IN (%s)' % (
+                 self._table(ArticleList), qn('read'), qn('notified'),
+                 qn('article_id'), qn('user_id'), qn('id'),
+                 qn('customuser_id'), articles, subscribers, qn('blog_id'),
+                 qn('blog_id'), qn('customuser_id'), seeded),
+             [False, True] + list(seeded_params)),
+            ('timeline',
+             'INSERT INTO %s (%s, %s, %s, %s, %s, %s) '
+             'SELECT s.%s, a.%s, a.%s, a.%s, a.%s, a.%s '
+             'FROM %s a INNER JOIN %s s ON s.%s = a.%s '
+             'WHERE s.%s IN (%s)' % (
+                 self._table(TimelineEntry), qn('user_id'),
+                 qn('article_id'), qn('published_date'), qn('slug'),
+                 qn('title'), qn('excerpt'), qn('customuser_id'),
+                 qn('id'), qn('published_date'), qn('slug'), qn('title'),
+                 qn('excerpt'), articles, subscribers, qn('blog_id'),
+                 qn('blog_id'), qn('customuser_id'), seeded),
+             list(seeded_params)),
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            for table, sql, params in statements:
+                started = time.time()
+                cursor.execute(sql, params)
+                self._count(table, max(cursor.rowcount, 0), started)
+            cursor.execute(
+                'UPDATE %s SET %s = (SELECT COUNT(*) FROM %s l '
+                'WHERE l.%s = %s.%s AND l.%s = %%s) '
+                'WHERE %s IN (%s)' % (
+                    self._table(CustomUser), qn('unread_count'),
+                    self._table(ArticleList), qn('user_id'),
+                    self._table(CustomUser), qn('id'), qn('read'), qn('id'),
+                    seeded),
+                [False] + list(seeded_params))
+
+    def report(self):
+        lines = []
+        for table, rows in self.counts.items():
+            elapsed = self.timings.get(table) or 0.0
+            lines.append('%-17s %10d rows %8.2fs %10.0f rows/s' % (
+                table, rows, elapsed, rows / elapsed if elapsed else 0))
+        total = sum(self.counts.values())
+        lines.append('%-17s %10d rows %8.2fs %10.0f rows/s' % (
+            'total', total, self.elapsed,
+            total / self.elapsed if self.elapsed else 0))
+        return lines
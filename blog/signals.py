@@ -1,17 +1,54 @@
-from django.dispatch import receiver, Signal
-from django.db.models.signals import post_save, m2m_changed
-from blog.models import Article, MailTemplate
-from tryit.celery import send_mail, add_log
-
-send_published = Signal(providing_args=["subscribers", "title", "description"])
-send2subscriber = Signal(providing_args=["subscriber", "title", "description"])
+from django.dispatch import receiver
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.models import User
+from blog.models import Article, ArticleComment, CustomImage, CustomUser, \
+    MailTemplate
+from blog.mailtemplates import mail_templates
+from blog.profiles import invalidate_profiles
+from blog.search import index_article
 
 
 @receiver(post_save, sender=Article)
-def article_published(sender, **kwargs):
-    created = kwargs.get('created')
-    instance = kwargs.get('instance')
-    if created and instance.is_published():
-        template = MailTemplate.objects.get(default=True)
-        send_mail(template.subject, template.message, template.from_addr,
-                  instance.subscribers)
+def article_indexed(sender, **kwargs):
+    if not kwargs.get('raw'):
+        index_article(kwargs.get('instance'))
+
+
+@receiver(post_save, sender=MailTemplate)
+@receiver(post_delete, sender=MailTemplate)
+def mail_template_changed(sender, **kwargs):
+    mail_templates.invalidate()
+
+
+@receiver(post_save, sender=ArticleComment)
+def comment_added(sender, **kwargs):
+    if kwargs.get('created') and not kwargs.get('raw'):
+        Article.objects.filter(pk=kwargs.get('instance').article_id)\
+            .update(comment_count=F('comment_count') + 1)
+
+
+@receiver(post_delete, sender=ArticleComment)
+def comment_deleted(sender, **kwargs):
+    Article.objects.filter(pk=kwargs.get('instance').article_id)\
+        .update(comment_count=Greatest(F('comment_count') - 1, 0))
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def profile_changed(sender, **kwargs):
+    invalidate_profiles(kwargs.get('instance').user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, **kwargs):
+    invalidate_profiles(kwargs.get('instance').pk)
+
+
+@receiver(post_save, sender=CustomImage)
+def avatar_changed(sender, **kwargs):
+    invalidate_profiles(*CustomUser.objects
+                        .filter(avatar=kwargs.get('instance'))
+                        .values_list('user_id', flat=True))
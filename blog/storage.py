@@ -0,0 +1,80 @@
+import gzip
+import io
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.txt', '.html', '.json',
+                '.eot', '.ttf')
+MIN_SIZE = 256
+
+
+def gzip_bytes(data):
+    buffer = io.BytesIO()
+    # mtime=0 keeps the output identical between two builds.
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9,
+                       mtime=0) as f:
+        f.write(data)
+    return buffer.getvalue()
+
+
+def compressors():
+    """(suffix, compress) pairs of the encodings built next to the files."""
+    result = [('.gz', gzip_bytes)]
+    if brotli is not None and getattr(settings, 'STATIC_BROTLI', True):
+        result.insert(0, ('.br', brotli.compress))
+    return result
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Content-hashed static files, each text file with .gz and, when the
+    brotli package is installed, .br siblings holding the same content
+    compressed ahead of time.
+    """
+
+    def hashed_name(self, name, content=None, *args, **kwargs):
+        try:
+            return super(CompressedManifestStaticFilesStorage, self)\
+                .hashed_name(name, content, *args, **kwargs)
+        except ValueError:
+            if content is not None:
+                raise
+            # Missing from STATIC_ROOT: a font the bundled CSS points to
+            # but that was never shipped, or collectstatic did not run yet.
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed = set()
+        for name, hashed_name, processed in super(
+                CompressedManifestStaticFilesStorage, self).post_process(
+                paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed.add(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name in sorted(hashed):
+            self.compress(name)
+
+    def compress(self, name):
+        if os.path.splitext(name)[1].lower() not in COMPRESSIBLE:
+            return
+        with self.open(name) as f:
+            data = f.read()
+        if len(data) < MIN_SIZE:
+            return
+        for suffix, compress in compressors():
+            compressed = compress(data)
+            if len(compressed) >= len(data):
+                continue
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(compressed))
@@ -0,0 +1,80 @@
+from celery.contrib.batches import Batches
+from django.conf import settings
+from tryit.celery import app
+from blog.models import Article, Blog, CustomImage, CustomUser
+from blog import avatars, digest, dispatch, fanout, receipts, timeline
+from blog.feed import prerender_article_feeds
+from blog.outbox import outbox
+
+READ_RECEIPTS = getattr(settings, 'BLOG_READ_RECEIPTS', {})
+
+
+@app.task
+def fan_out_article(article_pk):
+    article = Article.objects.select_related('blog').get(pk=article_pk)
+    result = fanout.article_to_subscribers(article)._asdict()
+    result['timeline'] = timeline.publish(article).inserted
+    if article.is_published():
+        prerender_article_feeds(article)
+    return result
+
+
+@app.task
+def fan_out_subscription(blog_pk, user_pk):
+    blog = Blog.objects.get(pk=blog_pk)
+    user = CustomUser.objects.get(pk=user_pk)
+    result = fanout.blog_to_subscriber(blog, user)._asdict()
+    result['timeline'] = timeline.backfill(blog, user).inserted
+    return result
+
+
+@app.task(base=Batches, acks_late=True,
+          flush_every=READ_RECEIPTS.get('batch_size', 500),
+          flush_interval=READ_RECEIPTS.get('flush_interval', 30))
+def write_read_receipts(requests):
+    """
+    Writes the receipts queued by article views, a batch at a time. The
+    messages are acknowledged once their batch is written, so the receipts
+    of a worker that dies are delivered again. A failed batch is
+    acknowledged as well, hence its receipts are queued again. The task
+    has its own queue, whose worker prefetches without limit: a batch
+    never waits for messages its worker is not allowed to fetch.
+    """
+    pairs = sorted(set((request.kwargs['user_id'],
+                        request.kwargs['article_id'])
+                       for request in requests))
+    try:
+        return receipts.write_receipts(
+            pairs, READ_RECEIPTS.get('batch_size', 500))
+    except Exception:
+        for user_id, article_id in pairs:
+            write_read_receipts.delay(user_id=user_id, article_id=article_id)
+        raise
+
+
+@app.task
+def render_article_feeds(article_pk):
+    prerender_article_feeds(Article.objects.get(pk=article_pk))
+
+
+@app.task
+def make_avatar_thumbnail(image_pk):
+    return avatars.make_thumbnail(CustomImage.objects.get(pk=image_pk))
+
+
+@app.task
+def drain_outbox():
+    return outbox.drain()._asdict()
+
+
+@app.task(bind=True, max_retries=3, default_retry_delay=60)
+def send_notification_chunk(self, chunk_pk):
+    try:
+        return dispatch.deliver_chunk(chunk_pk)._asdict()
+    except Exception as e:
+        raise self.retry(exc=e)
+
+
+@app.task
+def send_digests():
+    return digest.send_digests()._asdict()
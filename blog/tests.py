@@ -1,3 +1,1102 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.http import Http404
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.six import StringIO
+from blog import timeline, transfer
+from blog.assets import is_hashed, page_assets
+from blog.comments import comment_thread, vote
+from blog.counters import add_unread
+from blog.digest import send_digests
+from blog.dispatch import deliver_chunk, progress, split
+from blog.fanout import article_to_subscribers, blog_to_subscriber, \
+    insert_pairs
+from blog.feed import prerender_article_feeds
+from blog.middleware import Histogram, performance_stats
+from blog.mailtemplates import VERSION_KEY, MailTemplateRegistry, \
+    mail_templates
+from blog.models import Article, ArticleComment, ArticleList, Blog, \
+    Category, CustomImage, CustomUser, MailTemplate, Notification, \
+    NotificationChunk, SearchPosting, TimelineEntry
+from blog.outbox import Outbox
+from blog.pagination import KeysetPaginator
+from blog.profiles import PROFILE_KEY, load_profile
+from blog.queryaudit import PlanAuditor, capture_statements, hot_urls
+from blog.receipts import write_receipts
+from blog.rendering import EXCERPT_LENGTH, is_safe_url, render_content
+from blog.search import search, tokenize
+from blog.seeding import Seeder
+from blog.transfer import Importer, open_jsonl
+from tryit.celery import log_writer, reset_worker_connection
+from tryit.logs import GzipLogWriter, read_records
+
+
+class RejectingBackend(locmem.EmailBackend):
+    """Keeps the messages in mail.outbox but rejects rejected@ ones."""
+
+    def send_messages(self, messages):
+        return super(RejectingBackend, self).send_messages(
+            [message for message in messages
+             if not message.to[0].startswith('rejected@')])
+
+
+class ReentrantBackend(locmem.EmailBackend):
+    """Calls ``hook`` before sending, to run code mid-delivery."""
+
+    def send_messages(self, messages):
+        self.hook()
+        return super(ReentrantBackend, self).send_messages(messages)
+
+
+class FanOutTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('author', password='secret')
+        author = CustomUser.objects.create(user=user, phone='0')
+        blog = Blog.objects.create(name='blog', author=author)
+        self.blog = blog
+        self.article = Article.objects.create(name='article', blog=blog,
+                                              content='text', published=True)
+        self.readers = []
+        for i in range(3):
+            user = User.objects.create_user('reader%d' % i)
+            reader = CustomUser.objects.create(user=user, phone='0')
+            blog.subscribers.add(reader)
+            self.readers.append(reader)
+
+    def unread(self):
+        return [CustomUser.objects.get(pk=reader.pk).unread_count
+                for reader in self.readers]
+
+    def test_fan_out_is_idempotent(self):
+        self.assertEqual(article_to_subscribers(self.article).inserted, 3)
+        self.assertEqual(article_to_subscribers(self.article).inserted, 0)
+        self.assertEqual(self.unread(), [1, 1, 1])
+
+    def test_drafts_are_not_fanned_out(self):
+        draft = Article.objects.create(name='draft', blog=self.blog,
+                                       content='text')
+        self.assertEqual(article_to_subscribers(draft).inserted, 0)
+        user = User.objects.create_user('late')
+        late = CustomUser.objects.create(user=user, phone='0')
+        self.assertEqual(blog_to_subscriber(self.blog, late).inserted, 1)
+        self.assertEqual(self.unread(), [0, 0, 0])
+
+    def test_timeline_follows_edits_of_its_fields(self):
+        timeline.publish(self.article)
+        self.article.content = 'more text'
+        with CaptureQueriesContext(connection) as queries:
+            self.article.save()
+        self.assertFalse([query for query in queries
+                          if 'blog_timelineentry' in query['sql']])
+        self.article.title = 'edited'
+        self.article.save()
+        self.assertEqual(set(TimelineEntry.objects.values_list(
+            'title', flat=True)), set(['edited']))
+
+    def test_rows_inserted_meanwhile_are_skipped(self):
+        # Inserted by a concurrent fan-out after the pairs were computed.
+        ArticleList.objects.create(article=self.article,
+                                   user=self.readers[0])
+        pairs = [(self.article.pk, reader.pk) for reader in self.readers]
+        self.assertEqual(insert_pairs(pairs), 2)
+        self.assertEqual(ArticleList.objects
+                         .filter(article=self.article).count(), 3)
+        self.assertEqual(self.unread(), [0, 1, 1])
+
+
+class KeysetPaginationTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('author', password='secret')
+        author = CustomUser.objects.create(user=user, phone='0')
+        blog = Blog.objects.create(name='blog', author=author)
+        now = timezone.now()
+        self.articles = []
+        for i in range(5):
+            article = Article.objects.create(name='article %d' % i,
+                                             blog=blog, content='text')
+            # The two newest share a date, their pks break the tie.
+            Article.objects.filter(pk=article.pk).update(
+                published_date=now + timedelta(minutes=min(i, 3)))
+            self.articles.append(article)
+        self.paginator = KeysetPaginator(Article.objects.all(), per_page=2)
+
+    def pks(self, page):
+        return [article.pk for article in page]
+
+    def test_pages_follow_each_other(self):
+        page = self.paginator.page()
+        self.assertFalse(page.has_previous)
+        seen = self.pks(page)
+        while page.has_next:
+            page = self.paginator.page(before=page.next_cursor)
+            seen.extend(self.pks(page))
+        self.assertEqual(seen, [a.pk for a in reversed(self.articles)])
+
+    def test_previous_page(self):
+        first = self.paginator.page()
+        second = self.paginator.page(before=first.next_cursor)
+        self.assertTrue(second.has_previous)
+        back = self.paginator.page(after=second.previous_cursor)
+        self.assertEqual(self.pks(back), self.pks(first))
+        self.assertFalse(back.has_previous)
+        self.assertEqual(back.next_cursor, first.next_cursor)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(Http404):
+            self.paginator.page(before='not-a-cursor')
+
+
+class SubscriptionControlTest(TestCase):
+    # session, auth user, blogs with authors, own subscriptions and the
+    # unread counter, never cached; the rest of the profile comes from the
+    # cache
+    QUERY_BUDGET = 5
+
+    def setUp(self):
+        self.reader = self.create_user('reader')
+        self.blogs_count = 0
+        self.client.login(username='reader', password='secret')
+        self.client.get(reverse('blog-subscribe'))
+
+    def create_user(self, username):
+        user = User.objects.create_user(username, password='secret')
+        return CustomUser.objects.create(user=user, phone='0')
+
+    def add_blogs(self, count):
+        for i in range(self.blogs_count, self.blogs_count + count):
+            author = self.create_user('author%d' % i)
+            blog = Blog.objects.create(name='blog %d' % i, author=author)
+            blog.subscribers.add(self.reader, author)
+        self.blogs_count += count
+
+    def count_queries(self, method, *args):
+        with CaptureQueriesContext(connection) as queries:
+            response = method(reverse('blog-subscribe'), *args)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def unsubscribe_all_data(self):
+        names = Blog.objects.order_by('name').values_list('name', flat=True)
+        data = {'form-TOTAL_FORMS': len(names), 'form-INITIAL_FORMS': 0}
+        for i, name in enumerate(names):
+            data.update({'form-%d-blog_name' % i: name,
+                         'form-%d-author_name' % i: 'author'})
+        return data
+
+    def test_page_query_budget(self):
+        self.add_blogs(3)
+        few = self.count_queries(self.client.get)
+        self.add_blogs(30)
+        many = self.count_queries(self.client.get)
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, self.QUERY_BUDGET)
+
+    def test_unsubscribe_queries_do_not_depend_on_blogs(self):
+        self.add_blogs(3)
+        few = self.count_queries(self.client.post,
+                                 self.unsubscribe_all_data())
+        self.assertFalse(self.reader.blog_set.exists())
+        Blog.objects.all().delete()
+        self.add_blogs(30)
+        many = self.count_queries(self.client.post,
+                                  self.unsubscribe_all_data())
+        self.assertFalse(self.reader.blog_set.exists())
+        self.assertEqual(few, many)
+
+
+class FeedCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('author', password='secret')
+        author = CustomUser.objects.create(user=user, phone='0')
+        self.blog = Blog.objects.create(name='blog', author=author)
+
+    def publish(self, name):
+        article = Article.objects.create(name=name, blog=self.blog,
+                                         content='text', published=True)
+        # What fan_out_article does in the worker.
+        prerender_article_feeds(article)
+        return article
+
+    def test_publishing_renders_the_feeds_again(self):
+        self.publish('first')
+        first = self.client.get(reverse('feed'))
+        self.assertContains(first, 'first')
+        self.assertEqual(self.client.get(
+            reverse('feed'), HTTP_IF_NONE_MATCH=first['ETag']).status_code,
+            304)
+        self.publish('second')
+        for url in (reverse('feed'), reverse('feed-blog',
+                                             args=[self.blog.pk])):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertContains(response, 'second')
+            self.assertNotEqual(response['ETag'], first['ETag'])
+
+    def test_entries_expire(self):
+        self.publish('first')
+        with self.settings(BLOG_FEED_CACHE_TIMEOUT=0):
+            self.publish('second')
+        self.assertIsNone(cache.get('feed:latest:'))
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('author', password='secret')
+        author = CustomUser.objects.create(user=user, phone='0')
+        blog = Blog.objects.create(name='blog', author=author)
+        self.tips = Article.objects.create(
+            name='tips', blog=blog, title='Django tips', content='intro',
+            published=True)
+        self.other = Article.objects.create(
+            name='other', blog=blog, title='Other', description='summary',
+            content='about django', published=True)
+
+    def pks(self, query, **kwargs):
+        return [article.pk for article in search(query, **kwargs)]
+
+    def test_tokenize(self):
+        self.assertEqual(list(tokenize('The Quick, quick fox-trot!')),
+                         ['quick', 'quick', 'fox', 'trot'])
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.pks('django'), [self.tips.pk, self.other.pk])
+        self.assertEqual(self.pks('django tips'), [self.tips.pk])
+        self.assertEqual(self.pks('the'), [])
+
+    def test_pages(self):
+        first = search('django', per_page=1)
+        second = search('django', per_page=1, after=first.next_cursor)
+        self.assertEqual([a.pk for a in first], [self.tips.pk])
+        self.assertEqual([a.pk for a in second], [self.other.pk])
+        self.assertFalse(second.has_next)
+
+    def test_index_follows_saves(self):
+        self.other.title = 'More tips'
+        self.other.save()
+        self.assertEqual(self.pks('tips'), [self.other.pk, self.tips.pk])
+        self.tips.published = False
+        self.tips.save()
+        self.assertEqual(self.pks('tips'), [self.other.pk])
+
+    def test_candidates_are_bounded(self):
+        self.assertEqual(self.pks('django', candidates=1), [self.other.pk])
+
+    def test_rebuild(self):
+        SearchPosting.objects.all().delete()
+        call_command('rebuild_search_index', stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.pks('django'), [self.tips.pk, self.other.pk])
+
+
+class ReadReceiptTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('author', password='secret')
+        author = CustomUser.objects.create(user=user, phone='0')
+        blog = Blog.objects.create(name='blog', author=author)
+        self.article = Article.objects.create(name='article', blog=blog,
+                                              content='text', published=True)
+        user = User.objects.create_user('reader', password='secret')
+        self.reader = CustomUser.objects.create(user=user, phone='0')
+        ArticleList.objects.create(article=self.article, user=self.reader)
+        add_unread({self.reader.pk: 1})
+
+    def test_article_view_writes_nothing(self):
+        self.client.login(username='reader', password='secret')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('article-get',
+                                               args=[self.article.slug]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([query['sql'] for query in queries
+                          if not query['sql'].startswith('SELECT')], [])
+        self.assertFalse(ArticleList.objects.get(user=self.reader).read)
+
+    def test_receipt_delivered_again_changes_nothing(self):
+        receipt = (self.reader.user_id, self.article.pk)
+        self.assertEqual(write_receipts([receipt]), 1)
+        self.assertEqual(write_receipts([receipt]), 0)
+        self.assertTrue(ArticleList.objects.get(user=self.reader).read)
+        self.assertEqual(
+            CustomUser.objects.get(pk=self.reader.pk).unread_count, 0)
+
+
+class UnreadCounterTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('author', password='secret')
+        author = CustomUser.objects.create(user=user, phone='0')
+        blog = Blog.objects.create(name='blog', author=author)
+        self.articles = [Article.objects.create(name='article %d' % i,
+                                                blog=blog, content='text',
+                                                published=True)
+                         for i in range(3)]
+        user = User.objects.create_user('reader', password='secret')
+        self.reader = CustomUser.objects.create(user=user, phone='0')
+
+    def unread(self):
+        return CustomUser.objects.get(pk=self.reader.pk).unread_count
+
+    def test_counters_do_not_go_below_zero(self):
+        add_unread({self.reader.pk: 2})
+        add_unread({self.reader.pk: -5})
+        self.assertEqual(self.unread(), 0)
+        add_unread({self.reader.pk: 1, self.articles[0].blog.author.pk: 0})
+        self.assertEqual(self.unread(), 1)
+
+    def test_drafts_are_not_counted(self):
+        blog = self.articles[0].blog
+        blog.subscribers.add(self.reader)
+        article_to_subscribers(self.articles[0])
+        draft = Article.objects.create(name='draft', blog=blog,
+                                       content='text')
+        article_to_subscribers(draft)
+        self.assertEqual(self.unread(), 1)
+        # A row left from before drafts were skipped.
+        ArticleList.objects.create(article=draft, user=self.reader)
+        call_command('reconcile_unread', stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.unread(), 1)
+        write_receipts([(self.reader.user_id, draft.pk)])
+        self.assertEqual(self.unread(), 1)
+
+    def test_reconcile(self):
+        for article in self.articles:
+            ArticleList.objects.create(article=article, user=self.reader,
+                                       read=article == self.articles[0])
+        add_unread({self.reader.pk: 7})
+        call_command('reconcile_unread', chunk_size=1,
+                     stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.unread(), 2)
+
+
+class MailTemplateTest(TestCase):
+
+    def setUp(self):
+        self.template = MailTemplate.objects.create(
+            name='default', slug='default', subject='Old {{ title }}',
+            message='{{ article_url }}', default=True)
+
+    def test_saving_bumps_the_version(self):
+        registry = MailTemplateRegistry()
+        registry.get()
+        version = cache.get(VERSION_KEY)
+        self.template.save()
+        self.assertNotIn(cache.get(VERSION_KEY), (None, version))
+
+    def test_other_registries_recompile(self):
+        first, second = MailTemplateRegistry(), MailTemplateRegistry()
+        self.assertEqual(second.get().render({'title': 'a'})[0], 'Old a')
+        self.template.subject = 'New {{ title }}'
+        self.template.save()
+        self.assertIs(first.get(), first.get())
+        self.assertEqual(second.get().render({'title': 'a'})[0], 'New a')
+
+    def test_evicted_version_is_not_reused(self):
+        registry = MailTemplateRegistry()
+        registry.get()
+        cache.delete(VERSION_KEY)
+        MailTemplate.objects.filter(pk=self.template.pk)\
+            .update(subject='New {{ title }}')
+        self.assertEqual(registry.get().render({'title': 'a'})[0], 'New a')
+
+
+class LogWriterTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_records_are_read_back(self):
+        writer = GzipLogWriter(self.directory, 'mails', batch_size=2)
+        writer.write_many(['first', u'second \u2713', b'third'])
+        self.assertEqual(writer.pending, 1)
+        writer.close()
+        self.assertEqual(list(read_records(writer.path)),
+                         [b'first', u'second \u2713'.encode('utf-8'),
+                          b'third'])
+
+    def test_timer_flushes_a_partial_batch(self):
+        writer = GzipLogWriter(self.directory, 'mails', flush_interval=0.05)
+        writer.write('record')
+        for _ in range(100):
+            if not writer.pending:
+                break
+            time.sleep(0.05)
+        self.assertEqual(list(read_records(writer.path)), [b'record'])
+
+    def test_age_is_read_from_the_file(self):
+        path = os.path.join(self.directory, 'mails.gz')
+        day_ago = time.time() - 24 * 60 * 60
+        with gzip.GzipFile(path, 'wb', mtime=day_ago) as f:
+            f.write(b'')
+        # A writer started after the file, as after a restart.
+        writer = GzipLogWriter(self.directory, 'mails', max_age=60)
+        writer.write('record')
+        writer.flush()
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        writer.write('record')
+        writer.flush()
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        self.assertEqual(list(read_records(writer.path)),
+                         [b'record', b'record'])
+
+    def test_one_file_per_process(self):
+        with self.settings(SAVE_LOGS_DIR=self.directory):
+            writer = log_writer('worker')
+        self.assertEqual(os.path.basename(writer.path),
+                         'worker.%d.gz' % os.getpid())
+
+
+class GarbageCollectAvatarsTest(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        override = self.settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.files = {}
+        for name in ('default.png', 'used.png', 'thumbs/used.png',
+                     'unused.png', 'stray.png', 'tmp/upload.part'):
+            path = os.path.join(media, 'avatar', name)
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'wb').close()
+            self.files[name] = path
+        CustomImage.objects.create(img='avatar/default.png')
+        used = CustomImage.objects.create(img='avatar/used.png',
+                                          thumbnail='avatar/thumbs/used.png')
+        self.unused = CustomImage.objects.create(img='avatar/unused.png')
+        user = User.objects.create_user('reader')
+        CustomUser.objects.create(user=user, phone='0', avatar=used)
+
+    def gc(self, **options):
+        out = StringIO()
+        call_command('gc_avatars', stdout=out, **options)
+        return out.getvalue().strip()
+
+    def remaining(self):
+        return sorted(name for name, path in self.files.items()
+                      if os.path.exists(path))
+
+    def test_dry_run_changes_nothing(self):
+        self.assertEqual(self.gc(dry_run=True),
+                         'Found 1 unreferenced images and 1 orphaned files')
+        self.assertEqual(CustomImage.objects.count(), 3)
+        self.assertEqual(len(self.remaining()), 6)
+
+    def test_unreferenced_images_and_files_are_removed(self):
+        self.assertEqual(self.gc(),
+                         'Removed 1 unreferenced images and 2 orphaned '
+                         'files')
+        self.assertFalse(
+            CustomImage.objects.filter(pk=self.unused.pk).exists())
+        self.assertEqual(self.remaining(),
+                         ['default.png', 'thumbs/used.png',
+                          'tmp/upload.part', 'used.png'])
+
+
+class PerformanceMiddlewareTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('staff', password='secret',
+                                        is_staff=True)
+        CustomUser.objects.create(user=user, phone='0')
+        self.client.login(username='staff', password='secret')
+        performance_stats.clear()
+        self.addCleanup(performance_stats.clear)
+
+    def test_percentiles_are_finite(self):
+        histogram = Histogram()
+        for value in (3, 3, 7500):
+            histogram.add(value)
+        self.assertEqual(histogram.percentile(0.5), 5)
+        self.assertEqual(histogram.percentile(0.99), 7500)
+        self.assertEqual(histogram.as_dict()['max'], 7500)
+        self.assertIsNone(Histogram().percentile(0.5))
+
+    def test_sampled_requests_are_reported(self):
+        with self.settings(BLOG_PERFORMANCE={'sample_rate': 1,
+                                             'server_timing': True}):
+            response = self.client.get(reverse('blog-subscribe'))
+            self.assertIn('total;dur=', response['Server-Timing'])
+            stats = self.client.get(reverse('performance-stats')).json()
+        view = stats['blog-subscribe']
+        self.assertEqual(view['total_ms']['count'], 1)
+        self.assertGreater(view['queries']['p99'], 0)
+        self.assertEqual(view['queries']['p99'], view['queries']['max'])
+
+    def test_requests_are_not_sampled(self):
+        with self.settings(BLOG_PERFORMANCE={'sample_rate': 0}):
+            response = self.client.get(reverse('blog-subscribe'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(performance_stats.as_dict(), {})
+
+
+class SeederTest(TestCase):
+
+    def test_only_seeded_users_are_fanned_out(self):
+        seeder = Seeder(users=6, blogs=2, articles=10, subscriptions=2,
+                        prefix='gap', chunk_size=4)
+        seeder.seed_users()
+        seeder.seed_blogs()
+        seeder.seed_categories()
+        seeder.seed_articles()
+        # A user created by someone else between the seeded ones.
+        other = CustomUser.objects.get(pk=seeder.user_ids.pop(2))
+        User.objects.filter(pk=other.user_id).update(last_name='other')
+        CustomUser.objects.filter(pk=other.pk).update(unread_count=7)
+        Blog.objects.get(pk=seeder.blog_ids[0]).subscribers.add(other)
+        seeder.seed_subscriptions()
+        self.assertEqual(list(other.blog_set.values_list('pk', flat=True)),
+                         [seeder.blog_ids[0]])
+        self.assertFalse(ArticleList.objects.filter(user=other).exists())
+        self.assertFalse(TimelineEntry.objects.filter(user=other).exists())
+        self.assertEqual(CustomUser.objects.get(pk=other.pk).unread_count, 7)
+        for user in CustomUser.objects.filter(pk__in=seeder.user_ids):
+            self.assertEqual(user.unread_count,
+                             ArticleList.objects.filter(user=user).count())
+            self.assertEqual(user.unread_count, TimelineEntry.objects
+                             .filter(user=user).count())
+
+
+class QueryPlanAuditTest(TestCase):
+
+    def setUp(self):
+        Seeder(users=60, blogs=5, articles=300, subscriptions=3,
+               prefix='audit').run()
+        self.reader = CustomUser.objects.get(user__username='audit-0')
+        self.client.force_login(self.reader.user)
+        self.auditor = PlanAuditor(connection, min_rows=200)
+
+    def test_hot_pages_use_indexes(self):
+        slug = TimelineEntry.objects.filter(user=self.reader)\
+            .values_list('slug', flat=True).first()
+        findings = self.auditor.audit_urls(self.client, hot_urls(slug))
+        self.assertEqual([(f.url, f.kind, f.table, f.sql) for f in findings],
+                         [])
+
+    def test_unindexed_lookup_is_reported(self):
+        with capture_statements(connection) as statements:
+            list(Article.objects.filter(author_name='nobody'))
+        findings = self.auditor.audit(statements)
+        self.assertIn('seq_scan', [finding.kind for finding in findings])
+
+
+class OutboxTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('author', password='secret')
+        author = CustomUser.objects.create(user=user, phone='0')
+        self.blog = Blog.objects.create(name='blog', author=author)
+        self.blog.subscribers.add(author)
+
+    def publish(self, name):
+        return Article.objects.create(name=name, blog=self.blog,
+                                      content='text', published=True)
+
+    def test_publishing_only_writes_the_intent(self):
+        article = self.publish('first')
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Notification.objects.filter(
+            article=article, status=Notification.PENDING).count(), 1)
+
+    def test_only_publishing_notifies(self):
+        article = Article.objects.create(name='draft', blog=self.blog,
+                                         content='text', published=False)
+        self.assertIsNone(article.published_date)
+        self.assertFalse(Notification.objects.exists())
+        article.published = True
+        article.save()
+        published_date = article.published_date
+        self.assertIsNotNone(published_date)
+        article.content = 'edited'
+        article.save()
+        article = Article.objects.get(pk=article.pk)
+        article.save()
+        self.assertEqual(Notification.objects.filter(article=article)
+                         .count(), 1)
+        self.assertEqual(article.published_date, published_date)
+
+    def test_claims_do_not_overlap(self):
+        for name in ('first', 'second', 'third'):
+            self.publish(name)
+        first = Outbox(batch_size=2).claim()
+        second = Outbox(batch_size=2).claim()
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse(set(n.pk for n in first) & set(n.pk for n in second))
+        self.assertEqual(Outbox().claim(), [])
+
+    def test_expired_claim_is_taken_over(self):
+        self.publish('first')
+        claimed, = Outbox().claim()
+        Notification.objects.update(
+            claimed_at=timezone.now() - timedelta(seconds=601))
+        retaken, = Outbox(lease=600).claim()
+        self.assertEqual(retaken.pk, claimed.pk)
+        self.assertNotEqual(retaken.claimed_by, claimed.claimed_by)
+        self.assertEqual(retaken.attempts, 2)
+
+    def test_recipients_are_mailed_in_chunks(self):
+        MailTemplate.objects.create(name='default', slug='default',
+                                    subject='New article',
+                                    message='{{ article_url }}',
+                                    default=True)
+        for i in range(5):
+            user = User.objects.create_user('reader%d' % i,
+                                            'reader%d@example.com' % i)
+            self.blog.subscribers.add(
+                CustomUser.objects.create(user=user, phone='0'))
+        notification = Notification.objects.get(
+            article=self.publish('first'))
+        chunks = split(notification, chunk_size=2)
+        self.assertEqual([chunk.recipients for chunk in chunks], [2, 2, 2])
+        for chunk in notification.chunks.all():
+            deliver_chunk(chunk.pk)
+            deliver_chunk(chunk.pk)
+        # The author has no address.
+        self.assertEqual(len(mail.outbox), 5)
+        notification.refresh_from_db()
+        self.assertEqual(notification.sent, 5)
+        self.assertEqual(progress(notification),
+                         {NotificationChunk.DONE: (3, 6, 5, 0)})
+        self.assertEqual(notification.status, Notification.DONE)
+
+    def add_readers(self, count):
+        MailTemplate.objects.create(name='default', slug='default',
+                                    subject='New article',
+                                    message='{{ article_url }}',
+                                    default=True)
+        for i in range(count):
+            user = User.objects.create_user('reader%d' % i,
+                                            'reader%d@example.com' % i)
+            self.blog.subscribers.add(
+                CustomUser.objects.create(user=user, phone='0'))
+
+    def test_chunk_is_sent_once_when_run_concurrently(self):
+        self.add_readers(3)
+        notification = Notification.objects.get(
+            article=self.publish('first'))
+        split(notification)
+        chunk = notification.chunks.get()
+        results = []
+
+        def concurrent_run():
+            # Another worker gets the same chunk while this one is sending.
+            if not results:
+                results.append(deliver_chunk(chunk.pk))
+
+        reset_worker_connection()
+        self.addCleanup(reset_worker_connection)
+        ReentrantBackend.hook = staticmethod(concurrent_run)
+        self.addCleanup(delattr, ReentrantBackend, 'hook')
+        with self.settings(EMAIL_BACKEND='blog.tests.ReentrantBackend'):
+            result = deliver_chunk(chunk.pk)
+        self.assertEqual(results[0].recipients, 0)
+        self.assertEqual(result.sent, 3)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox),
+                         ['reader%d@example.com' % i for i in range(3)])
+        chunk.refresh_from_db()
+        self.assertEqual((chunk.status, chunk.attempts, chunk.claimed_by),
+                         (NotificationChunk.DONE, 1, ''))
+
+    def test_abandoned_chunk_is_taken_over(self):
+        self.add_readers(1)
+        notification = Notification.objects.get(
+            article=self.publish('first'))
+        split(notification)
+        NotificationChunk.objects.update(
+            status=NotificationChunk.SENDING, claimed_by='dead',
+            claimed_at=timezone.now() - timedelta(seconds=60))
+        chunk = notification.chunks.get()
+        self.assertEqual(deliver_chunk(chunk.pk, lease=120).recipients, 0)
+        self.assertEqual(deliver_chunk(chunk.pk, lease=30).sent, 1)
+
+    def test_run_stops_once_its_lease_is_taken_over(self):
+        self.add_readers(3)
+        notification = Notification.objects.get(
+            article=self.publish('first'))
+        split(notification)
+        chunk = notification.chunks.get()
+        claims = []
+
+        def take_over():
+            claims.append(NotificationChunk.objects.get(pk=chunk.pk)
+                          .claimed_at)
+            if len(claims) == 2:
+                # The lease expired during the first message.
+                NotificationChunk.objects.update(claimed_by='other',
+                                                 claimed_at=timezone.now())
+
+        reset_worker_connection()
+        self.addCleanup(reset_worker_connection)
+        ReentrantBackend.hook = staticmethod(take_over)
+        self.addCleanup(delattr, ReentrantBackend, 'hook')
+        with self.settings(EMAIL_BACKEND='blog.tests.ReentrantBackend',
+                           BLOG_MAIL_BATCH_SIZE=1):
+            result = deliver_chunk(chunk.pk)
+        self.assertGreater(claims[1], claims[0])
+        self.assertEqual((result.sent, len(mail.outbox)), (2, 2))
+        chunk.refresh_from_db()
+        self.assertEqual((chunk.status, chunk.claimed_by),
+                         (NotificationChunk.SENDING, 'other'))
+
+    def test_subscribers_are_listed_before_the_chunks_run(self):
+        self.add_readers(3)
+        article = self.publish('first')
+        self.assertEqual(Outbox().drain().chunks, 1)
+        self.assertEqual(ArticleList.objects.filter(article=article)
+                         .count(), 4)
+        deliver_chunk(Notification.objects.get(article=article)
+                      .chunks.get().pk)
+        # The author has no address.
+        self.assertEqual(ArticleList.objects.filter(
+            article=article, notified=True).count(), 3)
+
+    def test_notification_waits_for_failed_chunks(self):
+        self.add_readers(3)
+        notification = Notification.objects.get(
+            article=self.publish('first'))
+        outbox = Outbox(lease=600)
+        self.assertEqual(outbox.drain().chunks, 1)
+        chunk = notification.chunks.get()
+        NotificationChunk.objects.update(status=NotificationChunk.FAILED)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, Notification.CLAIMED)
+        # Nothing is queued again before the lease expires.
+        self.assertEqual(outbox.drain().chunks, 0)
+        Notification.objects.update(
+            claimed_at=timezone.now() - timedelta(seconds=601))
+        self.assertEqual(outbox.drain().chunks, 1)
+        deliver_chunk(chunk.pk)
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.sent),
+                         (Notification.DONE, 3))
+
+
+class DigestTest(TestCase):
+
+    def setUp(self):
+        MailTemplate.objects.create(name='default', slug='default',
+                                    subject='New article',
+                                    message='{{ article_url }}',
+                                    default=True)
+        user = User.objects.create_user('author', password='secret')
+        author = CustomUser.objects.create(user=user, phone='0')
+        user = User.objects.create_user('reader', 'reader@example.com')
+        self.reader = CustomUser.objects.create(user=user, phone='0',
+                                                digest=CustomUser.HOURLY)
+        blog = Blog.objects.create(name='blog', author=author)
+        for name in ('first', 'second', 'third'):
+            article = Article.objects.create(name=name, blog=blog,
+                                             content='text', published=True)
+            ArticleList.objects.create(article=article, user=self.reader)
+
+    def test_one_message_per_window(self):
+        blog = Blog.objects.get()
+        for name, deleted in (('draft', None), ('deleted', True)):
+            article = Article.objects.create(name=name, blog=blog,
+                                             content='text', deleted=deleted,
+                                             published=deleted)
+            ArticleList.objects.create(article=article, user=self.reader)
+        result = send_digests()
+        self.assertEqual((result.users, result.articles, result.sent),
+                         (1, 3, 1))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['reader@example.com'])
+        self.assertEqual(ArticleList.objects.filter(notified=False).count(),
+                         2)
+        self.assertEqual(send_digests().sent, 0)
+
+    def test_window_not_elapsed(self):
+        CustomUser.objects.filter(pk=self.reader.pk)\
+            .update(last_digest_at=timezone.now())
+        self.assertEqual(send_digests().users, 0)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_failed_digest_is_sent_again(self):
+        user = User.objects.create_user('rejected', 'rejected@example.com')
+        rejected = CustomUser.objects.create(user=user, phone='0',
+                                             digest=CustomUser.HOURLY)
+        for article in Article.objects.all():
+            ArticleList.objects.create(article=article, user=rejected)
+        reset_worker_connection()
+        self.addCleanup(reset_worker_connection)
+        with self.settings(EMAIL_BACKEND='blog.tests.RejectingBackend'):
+            result = send_digests()
+            self.assertEqual((result.users, result.articles, result.sent,
+                              result.failed), (2, 3, 1, 1))
+            self.assertEqual(ArticleList.objects.filter(
+                user=rejected, notified=False).count(), 3)
+            self.assertIsNone(
+                CustomUser.objects.get(pk=rejected.pk).last_digest_at)
+            self.assertEqual(send_digests().failed, 1)
+
+    def test_default_window_is_a_setting(self):
+        CustomUser.objects.filter(pk=self.reader.pk).update(digest=None)
+        MailTemplate.objects.filter(default=True).update(interval=3600)
+        mail_templates.invalidate()
+        self.assertEqual(send_digests().users, 0)
+        with self.settings(BLOG_DIGEST_WINDOW=CustomUser.HOURLY):
+            self.assertEqual(send_digests().users, 1)
+
+    def test_immediate_delivery_marks_rows_notified(self):
+        CustomUser.objects.filter(pk=self.reader.pk)\
+            .update(digest=CustomUser.IMMEDIATE)
+        article = Article.objects.get(name='first')
+        article.blog.subscribers.add(self.reader)
+        notification = Notification.objects.get(article=article)
+        split(notification)
+        for chunk in notification.chunks.all():
+            deliver_chunk(chunk.pk)
+        self.assertEqual(mail.outbox[0].to, ['reader@example.com'])
+        self.assertTrue(ArticleList.objects.get(article=article,
+                                                user=self.reader).notified)
+        CustomUser.objects.filter(pk=self.reader.pk)\
+            .update(digest=CustomUser.HOURLY)
+        self.assertEqual(send_digests().articles, 2)
+
+
+class CommentThreadTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('author', password='secret')
+        self.author = CustomUser.objects.create(user=user, phone='0')
+        blog = Blog.objects.create(name='blog', author=self.author)
+        self.article = Article.objects.create(name='article', blog=blog,
+                                              content='text')
+        self.comments = [ArticleComment.objects.create(
+            article=self.article, author=self.author, content=str(i))
+            for i in range(6)]
+
+    def test_comment_count_is_maintained(self):
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.comment_count, 6)
+        self.comments[0].delete()
+        self.article.save()
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.comment_count, 5)
+
+    def test_top_comments_are_not_repeated(self):
+        vote(self.comments[1].pk, 1)
+        self.assertEqual(vote(self.comments[1].pk, 1), 2)
+        self.article.refresh_from_db()
+        with self.assertNumQueries(2):
+            thread = comment_thread(self.article, top=2)
+            [comment.author.user for comment in thread.page]
+        self.assertEqual(thread.top[0].pk, self.comments[1].pk)
+        shown = [c.pk for c in thread.top] + [c.pk for c in thread.page]
+        self.assertEqual(sorted(shown), sorted(c.pk for c in self.comments))
+
+
+class ArticleRenderingTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('author', password='secret')
+        author = CustomUser.objects.create(user=user, phone='0')
+        self.blog = Blog.objects.create(name='blog', author=author)
+
+    def test_content_is_sanitized_once(self):
+        article = Article.objects.create(
+            name='article', blog=self.blog,
+            content='<p onclick="x()">Hello <b>world</b></p>'
+                    '<script>alert(1)</script><a href="javascript:x">y</a>')
+        self.assertEqual(article.content_html,
+                         '<p>Hello <b>world</b></p><a>y</a>')
+        self.assertEqual(article.word_count, 3)
+
+    def test_obfuscated_schemes_are_dropped(self):
+        for href in ('java\tscript:x()', 'java\nscript:x()',
+                     ' \x01javascript:x()', 'javascript&#58;x()',
+                     '&#106;avascript:x()', 'JaVaScRiPt:x()',
+                     'data:text/html;base64,PHNjcmlwdD4=', 'vbscript:x'):
+            self.assertEqual(render_content('<p><a href="%s">y</a></p>'
+                                            % href),
+                             '<p><a>y</a></p>', href)
+
+    def test_safe_urls_are_kept(self):
+        for href in ('http://example.com/', 'HTTPS://example.com/a:b',
+                     'mailto:a@example.com', '/article/x', '#top', '?page=2',
+                     'article/x:y', '../x'):
+            self.assertTrue(is_safe_url(href), href)
+        self.assertEqual(render_content('<img src="/a.png">'),
+                         '<p><img src="/a.png"></p>')
+
+    def test_self_closing_script_keeps_the_text_after_it(self):
+        self.assertEqual(render_content('<p><script/>Hello <b/>world</p>'),
+                         '<p>Hello <b></b>world</p>')
+        self.assertEqual(render_content('<style/><p>text</p>'),
+                         '<p>text</p>')
+
+    def test_excerpt_is_bounded(self):
+        article = Article.objects.create(name='article', blog=self.blog,
+                                         content='word ' * 2000)
+        self.assertEqual(article.description, ('word ' * 2000)[:1024])
+        self.assertLessEqual(len(article.excerpt), EXCERPT_LENGTH)
+        self.assertEqual(article.word_count, 2000)
+
+
+class StaticPipelineTest(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        override = self.settings(STATIC_ROOT=self.root)
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_page_links_precompressed_hashed_css(self):
+        names = page_assets(self.client.get(reverse('index'))
+                            .content.decode('utf-8'))
+        self.assertEqual(len(names), 1)
+        self.assertTrue(is_hashed(names[0]))
+        self.assertTrue(os.path.isfile(os.path.join(self.root,
+                                                    names[0] + '.gz')))
+        response = self.client.get(settings.STATIC_URL + names[0],
+                                   HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+
+
+class TransferTest(TestCase):
+
+    def setUp(self):
+        Seeder(users=30, blogs=3, articles=40, categories=4,
+               subscriptions=2, prefix='transfer').run()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.path = os.path.join(self.root, 'blog.jsonl.gz')
+
+    def snapshot(self):
+        return (
+            sorted(Category.objects.values_list('name', flat=True)),
+            sorted(Blog.objects.values_list('name', 'created', 'updated')),
+            sorted(Blog.subscribers.through.objects.values_list(
+                'blog__name', 'customuser__user__username')),
+            sorted(Article.objects.values_list('name', 'slug', 'excerpt',
+                                               'blog__name', 'created',
+                                               'updated')),
+            sorted(Article.category.through.objects.values_list(
+                'article__name', 'category__name')),
+            sorted(ArticleList.objects.values_list(
+                'article__name', 'user__user__username', 'read')),
+            sorted(TimelineEntry.objects.values_list(
+                'article__name', 'user__user__username')),
+        )
+
+    def export_and_clear(self):
+        month_ago = timezone.now() - timedelta(days=30)
+        for i, pk in enumerate(Article.objects.values_list('pk', flat=True)):
+            Article.objects.filter(pk=pk).update(
+                created=month_ago + timedelta(hours=i),
+                updated=month_ago + timedelta(hours=i, minutes=5))
+        Blog.objects.update(created=month_ago, updated=month_ago)
+        call_command('export_blog_data', self.path, chunk_size=7,
+                     stdout=open(os.devnull, 'w'))
+        before = self.snapshot()
+        Blog.objects.all().delete()
+        Category.objects.all().delete()
+        return before
+
+    def test_round_trip(self):
+        before = self.export_and_clear()
+        call_command('import_blog_data', self.path, batch_size=9,
+                     stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.snapshot(), before)
+        self.assertFalse(os.path.exists(self.path + '.checkpoint'))
+        self.assertEqual(
+            SearchPosting.objects.values('article_id').distinct().count(),
+            Article.objects.filter(published=True).count())
+        title = Article.objects.order_by('pk').first().title
+        self.assertTrue(search(title).object_list)
+
+    def test_lookups_are_split_in_chunks(self):
+        self.addCleanup(setattr, transfer, 'LOOKUP_CHUNK_SIZE',
+                        transfer.LOOKUP_CHUNK_SIZE)
+        transfer.LOOKUP_CHUNK_SIZE = 4
+        before = self.export_and_clear()
+        for _ in range(2):
+            call_command('import_blog_data', self.path, batch_size=9,
+                         stdout=open(os.devnull, 'w'))
+            self.assertEqual(self.snapshot(), before)
+
+    def test_imported_content_is_rendered_again(self):
+        self.export_and_clear()
+        lines, forged = [], None
+        with open_jsonl(self.path) as stream:
+            for line in stream:
+                record = json.loads(line)
+                if record['type'] == 'article' and forged is None:
+                    forged = record['name']
+                    record.update(content='<p>Hi<script>x()</script></p>',
+                                  content_html='<script>x()</script>',
+                                  word_count=7)
+                    line = json.dumps(record)
+                lines.append(line)
+        Importer().run(lines)
+        article = Article.objects.get(name=forged)
+        self.assertEqual((article.content_html, article.word_count),
+                         ('<p>Hi</p>', 1))
+
+    def test_resume_after_checkpoint(self):
+        before = self.export_and_clear()
+        done = []
+        with open_jsonl(self.path) as stream:
+            lines = [line for _, line in zip(range(50), stream)]
+        Importer(batch_size=9).run(lines, checkpoint=done.append)
+        with open_jsonl(self.path) as stream:
+            Importer(batch_size=9).run(stream, start=done[-1])
+        self.assertEqual(self.snapshot(), before)
+
+
+class ProfileMiddlewareTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('reader', password='secret')
+        self.profile = CustomUser.objects.create(user=user, phone='0')
+        self.client.login(username='reader', password='secret')
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('articles-get'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_profile_is_cached_until_saved(self):
+        first = self.count_queries()
+        self.assertEqual(self.count_queries(), first - 1)
+        self.profile.save()
+        self.assertIsNone(cache.get(PROFILE_KEY % self.profile.user_id))
+        self.assertEqual(self.count_queries(), first)
+
+    def test_deleted_profile_is_dropped(self):
+        self.assertEqual(load_profile(self.profile.user).pk, self.profile.pk)
+        user = self.profile.user
+        self.profile.delete()
+        self.assertIsNone(cache.get(PROFILE_KEY % user.pk))
+        self.assertIsNone(load_profile(user))
 
-# Create your tests here.
+    def test_unread_count_is_read_fresh(self):
+        load_profile(self.profile.user)
+        add_unread({self.profile.pk: 2})
+        self.assertEqual(load_profile(self.profile.user).unread_count, 2)
@@ -0,0 +1,93 @@
+import logging
+import time
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from blog.fanout import FanOutResult, chunked, get_chunk_size
+from blog.models import Blog, TimelineEntry
+
+logger = logging.getLogger(__name__)
+
+
+def _bulk_insert(entries):
+    with transaction.atomic():
+        TimelineEntry.objects.bulk_create(entries)
+    return len(entries)
+
+
+def insert_entries(entries):
+    """
+    Inserts timeline entries, skipping the (user, article) pairs a
+    concurrent run has already written.
+    """
+    try:
+        return _bulk_insert(entries)
+    except IntegrityError:
+        existing = set(TimelineEntry.objects
+                       .filter(user_id__in=set(e.user_id for e in entries),
+                               article_id__in=set(e.article_id
+                                                  for e in entries))
+                       .values_list('user_id', 'article_id'))
+        missing = [entry for entry in entries
+                   if (entry.user_id, entry.article_id) not in existing]
+        return _bulk_insert(missing) if missing else 0
+
+
+def _insert_all(entries, chunk_size=None):
+    started = time.time()
+    inserted = 0
+    for chunk in chunked(entries, chunk_size or get_chunk_size()):
+        inserted += insert_entries(chunk)
+    return FanOutResult(inserted, time.time() - started)
+
+
+def publish(article, chunk_size=None):
+    """Writes the article into the timeline of every subscriber of its blog."""
+    if not article.blog_id or not article.is_published():
+        return FanOutResult(0, 0.0)
+    fields = TimelineEntry.fields_from(article)
+    user_ids = list(article.blog.subscribers
+                    .exclude(timelineentry__article=article)
+                    .order_by().values_list('pk', flat=True))
+    result = _insert_all((TimelineEntry(user_id=user_id,
+                                        article_id=article.pk, **fields)
+                          for user_id in user_ids), chunk_size)
+    logger.info('Article %s written to %d timelines in %.3fs',
+                article.pk, result.inserted, result.elapsed)
+    return result
+
+
+def publish_many(articles, chunk_size=None):
+    """
+    Writes articles that have no timeline entries yet, such as freshly
+    imported ones, into the timelines of their subscribers. The
+    subscribers of all their blogs are read with one query.
+    """
+    articles = [article for article in articles
+                if article.blog_id and article.is_published()]
+    Through = Blog.subscribers.through
+    subscribers = defaultdict(list)
+    for blog_id, user_id in Through.objects.filter(
+            blog_id__in=set(article.blog_id for article in articles))\
+            .values_list('blog_id', 'customuser_id'):
+        subscribers[blog_id].append(user_id)
+    return _insert_all((TimelineEntry(user_id=user_id,
+                                      article_id=article.pk,
+                                      **TimelineEntry.fields_from(article))
+                        for article in articles
+                        for user_id in subscribers[article.blog_id]),
+                       chunk_size)
+
+
+def backfill(blog, user, chunk_size=None):
+    """Writes the published articles of the blog into the user timeline."""
+    articles = blog.article_set.filter(published=True)\
+        .exclude(timelineentry__user=user).order_by()\
+        .only('published_date', 'slug', 'title', 'excerpt')
+    result = _insert_all((TimelineEntry(user_id=user.pk,
+                                        article_id=article.pk,
+                                        **TimelineEntry.fields_from(article))
+                          for article in list(articles)), chunk_size)
+    logger.info('Blog %s backfilled %d timeline entries of user %s in %.3fs',
+                blog.pk, result.inserted, user.pk, result.elapsed)
+    return result
@@ -0,0 +1,326 @@
+import datetime
+import gzip
+import io
+import json
+import time
+from collections import Counter, OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Q, Value, When
+from django.utils import six
+from django.utils.dateparse import parse_datetime
+from blog.counters import add_unread
+from blog.fanout import chunked
+from blog.models import Article, ArticleList, Blog, Category, CustomUser, \
+    SearchPosting
+from blog.rendering import render_article
+from blog.search import is_indexable, postings_for
+from blog.timeline import publish_many
+
+# The rendered HTML, excerpt and word count are not exported: the importer
+# renders the content again rather than trust markup from the file.
+ARTICLE_FIELDS = ('name', 'slug', 'title', 'description', 'content',
+                  'published', 'published_date', 'deleted', 'author_name')
+# bulk_create stamps rows with the current time, the exported stamps are
+# written back with UPDATEs of this many rows.
+TIMESTAMPS = ('created', 'updated')
+TIMESTAMP_CHUNK_SIZE = 150
+# SQLite takes at most 999 parameters per query, the lookups of a batch by
+# name, username or pk are split into chunks of this many values; two fit
+# in one query.
+LOOKUP_CHUNK_SIZE = 450
+
+
+class TransferEncoder(DjangoJSONEncoder):
+    """Keeps the microseconds of datetimes, which DjangoJSONEncoder drops."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super(TransferEncoder, self).default(o)
+
+
+def open_jsonl(path, mode='r', compress=None):
+    """Opens a JSON Lines file, gzipped when asked or named *.gz."""
+    if compress is None:
+        compress = path.endswith('.gz')
+    if compress:
+        return io.TextIOWrapper(gzip.GzipFile(path, mode + 'b'),
+                                encoding='utf-8')
+    return io.open(path, mode, encoding='utf-8')
+
+
+def iterate(queryset, fields, chunk_size):
+    """
+    Yields the ``fields`` of every row in pk order. Each chunk is a range
+    query starting after the last pk seen, so no cursor stays open and
+    memory is bounded by ``chunk_size``.
+    """
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk).order_by('pk')
+                    .values_list('pk', *fields)[:chunk_size])
+        if not rows:
+            return
+        for row in rows:
+            yield row[1:]
+        last_pk = rows[-1][0]
+
+
+def exports():
+    """(record type, queryset, fields, keys) in dependency order."""
+    return (
+        ('category', Category.objects.all(), ('name',), ('name',)),
+        ('blog', Blog.objects.all(),
+         ('name', 'author__user__username', 'deleted') + TIMESTAMPS,
+         ('name', 'author', 'deleted') + TIMESTAMPS),
+        ('subscription', Blog.subscribers.through.objects.all(),
+         ('blog__name', 'customuser__user__username'), ('blog', 'user')),
+        ('article', Article.objects.all(),
+         ARTICLE_FIELDS + TIMESTAMPS + ('blog__name',),
+         ARTICLE_FIELDS + TIMESTAMPS + ('blog',)),
+        ('article_category', Article.category.through.objects.all(),
+         ('article__name', 'category__name'), ('article', 'category')),
+        ('article_list', ArticleList.objects.all(),
+         ('article__name', 'user__user__username', 'read', 'notified'),
+         ('article', 'user', 'read', 'notified')),
+    )
+
+
+class Transfer(object):
+    """Rows and seconds per record type, for the throughput report."""
+
+    def __init__(self):
+        self.counts = OrderedDict()
+        self.timings = OrderedDict()
+        self.skipped = Counter()
+        self.started = time.time()
+
+    def _count(self, kind, rows, started):
+        self.counts[kind] = self.counts.get(kind, 0) + rows
+        self.timings[kind] = self.timings.get(kind, 0.0) + \
+            time.time() - started
+
+    def report(self):
+        lines = []
+        for kind, rows in self.counts.items():
+            elapsed = self.timings[kind]
+            lines.append('%-17s %10d rows %8.2fs %10.0f rows/s%s' % (
+                kind, rows, elapsed, rows / elapsed if elapsed else 0,
+                '  (%d skipped)' % self.skipped[kind]
+                if self.skipped[kind] else ''))
+        total = sum(self.counts.values())
+        elapsed = time.time() - self.started
+        lines.append('%-17s %10d rows %8.2fs %10.0f rows/s' % (
+            'total', total, elapsed, total / elapsed if elapsed else 0))
+        return lines
+
+
+class Exporter(Transfer):
+    """Writes the blog data as one JSON object per line."""
+
+    def __init__(self, chunk_size=1000):
+        super(Exporter, self).__init__()
+        self.chunk_size = chunk_size
+
+    def export(self, stream):
+        for kind, queryset, fields, keys in exports():
+            started = time.time()
+            rows = 0
+            for values in iterate(queryset, fields, self.chunk_size):
+                record = OrderedDict([('type', kind)])
+                record.update(zip(keys, values))
+                # Text streams take unicode only, on Python 2 as well.
+                stream.write(six.text_type(
+                    json.dumps(record, cls=TransferEncoder)) + u'\n')
+                rows += 1
+            self._count(kind, rows, started)
+
+
+class Importer(Transfer):
+    """
+    Loads an export through bulk inserts of ``batch_size`` records of one
+    type. References are resolved by name and username, one query per
+    batch and model; rows that already exist are skipped, so importing a
+    file again, or again from an older checkpoint, changes nothing.
+
+    Nothing goes through save or the post_save signals: blogs and articles
+    get their exported timestamps back with bulk UPDATEs, the content of
+    articles is rendered as save would, and every batch of articles is
+    indexed for search and written into the timelines of the subscribers
+    imported before it.
+    """
+
+    def __init__(self, batch_size=1000):
+        super(Importer, self).__init__()
+        self.batch_size = batch_size
+
+    def run(self, lines, start=0, checkpoint=None):
+        """
+        Imports the lines after the ``start`` first ones and calls
+        ``checkpoint`` with the number of lines done after every batch is
+        committed.
+        """
+        batch, kind, number = [], None, start
+        for number, line in enumerate(lines, 1):
+            if number <= start or not line.strip():
+                continue
+            record = json.loads(line)
+            if batch and (record['type'] != kind or
+                          len(batch) >= self.batch_size):
+                self._flush(kind, batch, number - 1, checkpoint)
+                batch = []
+            kind = record['type']
+            batch.append(record)
+        if batch:
+            self._flush(kind, batch, number, checkpoint)
+
+    def _flush(self, kind, records, done, checkpoint):
+        handler = getattr(self, 'import_%s' % kind, None)
+        if handler is None:
+            raise ValueError('Unknown record type %r' % kind)
+        started = time.time()
+        with transaction.atomic():
+            inserted = handler(records)
+        self._count(kind, inserted, started)
+        self.skipped[kind] += len(records) - inserted
+        if checkpoint is not None:
+            checkpoint(done)
+
+    def _names(self, model, names, field='name'):
+        found = {}
+        for chunk in chunked(set(names), LOOKUP_CHUNK_SIZE):
+            found.update(model.objects.filter(**{field + '__in': chunk})
+                         .values_list(field, 'pk'))
+        return found
+
+    def _users(self, usernames):
+        return self._names(CustomUser, usernames, 'user__username')
+
+    def _restore_timestamps(self, model, records):
+        pks = self._names(model, [r['name'] for r in records])
+        stamps = dict((pks[r['name']], r) for r in records
+                      if r['name'] in pks and r.get('created'))
+        for chunk in chunked(sorted(stamps), TIMESTAMP_CHUNK_SIZE):
+            model.objects.filter(pk__in=chunk).update(**dict(
+                (field, Case(*[When(pk=pk, then=Value(
+                    parse_datetime(stamps[pk][field]),
+                    output_field=DateTimeField())) for pk in chunk]))
+                for field in TIMESTAMPS))
+        return pks
+
+    def _new_pairs(self, model, first, second, pairs):
+        """The (first, second) pairs of ``pairs`` not in the table yet."""
+        pairs = set(pairs)
+        existing = set()
+        for chunk in chunked(sorted(pairs), LOOKUP_CHUNK_SIZE):
+            existing.update(model.objects.filter(**{
+                first + '__in': set(a for a, _ in chunk),
+                second + '__in': set(b for _, b in chunk)})
+                .values_list(first, second))
+        return sorted(pairs - existing)
+
+    def import_category(self, records):
+        existing = self._names(Category, [r['name'] for r in records])
+        names = set(r['name'] for r in records) - set(existing)
+        Category.objects.bulk_create([Category(name=name)
+                                      for name in sorted(names)])
+        return len(names)
+
+    def import_blog(self, records):
+        existing = self._names(Blog, [r['name'] for r in records])
+        users = self._users(r['author'] for r in records)
+        blogs = OrderedDict((r['name'], Blog(name=r['name'],
+                                             author_id=users[r['author']],
+                                             deleted=r['deleted']))
+                            for r in records
+                            if r['name'] not in existing and
+                            r['author'] in users)
+        Blog.objects.bulk_create(list(blogs.values()))
+        self._restore_timestamps(Blog, [r for r in records
+                                        if r['name'] in blogs])
+        return len(blogs)
+
+    def import_subscription(self, records):
+        blogs = self._names(Blog, [r['blog'] for r in records])
+        users = self._users(r['user'] for r in records)
+        Through = Blog.subscribers.through
+        pairs = self._new_pairs(Through, 'blog_id', 'customuser_id', (
+            (blogs[r['blog']], users[r['user']]) for r in records
+            if r['blog'] in blogs and r['user'] in users))
+        Through.objects.bulk_create([
+            Through(blog_id=blog_id, customuser_id=user_id)
+            for blog_id, user_id in pairs])
+        return len(pairs)
+
+    def import_article(self, records):
+        existing, taken = set(), set()
+        for chunk in chunked(records, LOOKUP_CHUNK_SIZE):
+            for name, slug in Article.objects.filter(
+                    Q(name__in=set(r['name'] for r in chunk)) |
+                    Q(slug__in=set(r['slug'] for r in chunk))) \
+                    .values_list('name', 'slug'):
+                existing.add(name)
+                taken.add(slug)
+        blogs = self._names(Blog, [r['blog'] for r in records if r['blog']])
+        articles = OrderedDict()
+        for record in records:
+            if record['name'] in existing or record['slug'] in taken or \
+                    (record['blog'] and record['blog'] not in blogs):
+                continue
+            fields = dict((name, record[name]) for name in ARTICLE_FIELDS)
+            fields['published_date'] = fields['published_date'] and \
+                parse_datetime(fields['published_date'])
+            existing.add(record['name'])
+            taken.add(record['slug'])
+            articles[record['name']] = render_article(Article(
+                blog_id=blogs.get(record['blog']), **fields))
+        Article.objects.bulk_create(list(articles.values()))
+        pks = self._restore_timestamps(Article, [r for r in records
+                                                 if r['name'] in articles])
+        for name, article in articles.items():
+            article.pk = pks[name]
+        SearchPosting.objects.bulk_create([
+            posting for article in articles.values()
+            if is_indexable(article) for posting in postings_for(article)])
+        publish_many(articles.values())
+        return len(articles)
+
+    def import_article_category(self, records):
+        articles = self._names(Article, [r['article'] for r in records])
+        categories = self._names(Category, [r['category'] for r in records])
+        Link = Article.category.through
+        pairs = self._new_pairs(Link, 'article_id', 'category_id', (
+            (articles[r['article']], categories[r['category']])
+            for r in records
+            if r['article'] in articles and r['category'] in categories))
+        Link.objects.bulk_create([
+            Link(article_id=article_id, category_id=category_id)
+            for article_id, category_id in pairs])
+        return len(pairs)
+
+    def import_article_list(self, records):
+        articles = self._names(Article, [r['article'] for r in records])
+        users = self._users(r['user'] for r in records)
+        # Rows exported before notifications were tracked have NULL, their
+        # subscribers were mailed already.
+        states = dict(((articles[r['article']], users[r['user']]),
+                       (r['read'], r['notified'] is not False))
+                      for r in records
+                      if r['article'] in articles and r['user'] in users)
+        pairs = self._new_pairs(ArticleList, 'article_id', 'user_id', states)
+        ArticleList.objects.bulk_create([
+            ArticleList(article_id=article_id, user_id=user_id,
+                        read=states[article_id, user_id][0],
+                        notified=states[article_id, user_id][1])
+            for article_id, user_id in pairs])
+        published = set()
+        for chunk in chunked(sorted(set(a for a, _ in pairs)),
+                             LOOKUP_CHUNK_SIZE):
+            published.update(Article.objects.filter(
+                pk__in=chunk, published=True).values_list('pk', flat=True))
+        add_unread(Counter(user_id for article_id, user_id in pairs
+                           if not states[article_id, user_id][0] and
+                           article_id in published))
+        return len(pairs)
@@ -6,15 +6,29 @@ urlpatterns = [
     url(r'^$', views.hello, name='index'),
     url(r'^article/(?P<slug>[0-9a-zA-Z-_.]*)/$', views.get_article,
         name='article-get'),
+    url(r'^article/(?P<slug>[0-9a-zA-Z-_.]*)/comments/$',
+        views.get_article_comments, name='article-comments'),
+    url(r'^article/(?P<slug>[0-9a-zA-Z-_.]*)/comments/add/$',
+        views.add_article_comment, name='article-comment-add'),
+    url(r'^comment/(?P<pk>\d+)/vote/$', views.vote_comment,
+        name='comment-vote'),
     url(r'^myarticles/$', views.get_user_articles, name='articles-get-user'),
     url(r'^articles/$', views.get_subscribed_articles, name='articles-get'),
     url(r'^add/$', views.add_article, name='article-add'),
     url(r'^edit/(?P<pk>\d+)/$', views.update_article, name='article-edit'),
-    url(r'^feed/$', feed.LatestArticles(), name="feed"),
+    url(r'^feed/$', feed.cached_feed, name="feed"),
+    url(r'^feed/blog/(?P<pk>\d+)/$', feed.cached_feed, {'kind': 'blog'},
+        name="feed-blog"),
+    url(r'^feed/category/(?P<pk>\d+)/$', feed.cached_feed,
+        {'kind': 'category'}, name="feed-category"),
     url(r'^(?P<pk>\d+)/info/$', views.CustomUserUpdateView.as_view(),
         name="custom_info"),
     url(r'^out/$', views.signout, name="logout"),
     url(r'^subscribe/$', views.control_subscription, name='blog-subscribe'),
+    url(r'^search/$', views.search_articles, name='article-search'),
+    url(r'^cache/stats/$', views.cache_stats, name='cache-stats'),
+    url(r'^perf/stats/$', views.performance_stats_view,
+        name='performance-stats'),
 
 
 ]
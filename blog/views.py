@@ -1,14 +1,32 @@
-from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import AuthenticationForm
+from django.db import transaction
 from django.forms.formsets import formset_factory
-from blog.models import Article, Blog, ArticleList, CustomUser
-from blog.forms import ArticleCreationForm, BlogSubscribeForm, \
-    CustomUserCreateForm, CustomUserUpdateForm, ArticleUpdatingForm
+from blog.models import Article, Blog, ArticleList, CustomUser, \
+    TimelineEntry
+from blog.forms import ArticleCommentForm, ArticleCreationForm, \
+    BlogSubscribeForm, CustomUserCreateForm, CustomUserUpdateForm, \
+    ArticleUpdatingForm
+from blog.cache import article_cache
+from blog.comments import comment_as_dict, comment_thread, vote
+from blog.counters import add_unread, counted
+from blog.middleware import performance_stats
+from blog.pagination import paginate
+from blog.search import search
+from blog.tasks import fan_out_subscription, render_article_feeds, \
+    write_read_receipts
+from django.views.decorators.http import require_POST
 from django.views.generic.edit import CreateView, UpdateView
 from django.core.urlresolvers import reverse_lazy
 
 HELLO = "Hello, guest. You're in the blog now, welcome."
+# Columns the article listings render and paginate on.
+LISTING_FIELDS = ('slug', 'title', 'excerpt', 'published_date', 'created')
 
 
 def signout(request):
@@ -35,7 +53,9 @@ def hello(request):
 
 
 def get_articles(request):
-    context = {'objects': Article.objects.filter(published=True),
+    page = paginate(request, Article.objects.filter(published=True)
+                    .only(*LISTING_FIELDS))
+    context = {'objects': page.object_list, 'page': page,
                'title': "Latest published articles"}
     return render(request, 'articles.html', context)
 
@@ -43,41 +63,77 @@ def get_articles(request):
 def get_user_articles(request):
     user = request.user
     blog = Blog.objects.filter(author__pk=user.pk)
-    context = {'objects': Article.objects.filter(blog=blog),
+    page = paginate(request, Article.objects.filter(blog=blog)
+                    .only(*LISTING_FIELDS), 'created')
+    context = {'objects': page.object_list, 'page': page,
                'title': "My articles"}
     return render(request, 'articles_user.html', context)
 
 
 def get_article(request, slug):
-    obj = Article.objects.get(slug=slug)
-    user = CustomUser.objects.get(user=request.user)
-    if ArticleList.objects.filter(article=obj, user=user, read=False).exists():
-        article = ArticleList.objects.filter(article=obj, user=user,
-                                             read=False)[0]
-        article.read = True
-        article.save(update_fields=['read'])
-    context = {'obj': obj}
+    obj = Article.objects.only('slug', 'updated', 'comment_count')\
+        .get(slug=slug)
+    body = article_cache.get(obj)
+    if body is None:
+        obj = Article.objects.get(pk=obj.pk)
+        body = render_to_string('article_body.html', {'obj': obj})
+        article_cache.set(obj, body)
+    if request.user.is_authenticated():
+        # Queued for the workers: the page itself writes nothing.
+        write_read_receipts.delay(user_id=request.user.pk, article_id=obj.pk)
+    thread = comment_thread(obj, before=request.GET.get('before'),
+                            after=request.GET.get('after'))
+    context = {'obj': obj, 'body': body, 'thread': thread,
+               'page': thread.page, 'comment_form': ArticleCommentForm()}
     return render(request, 'article.html', context)
 
 
+def get_article_comments(request, slug):
+    article = get_object_or_404(Article.objects.only('comment_count'),
+                                slug=slug)
+    thread = comment_thread(article, before=request.GET.get('before'),
+                            after=request.GET.get('after'))
+    return JsonResponse({
+        'count': thread.count,
+        'top': [comment_as_dict(comment) for comment in thread.top],
+        'comments': [comment_as_dict(comment) for comment in thread.page],
+        'next': thread.page.next_cursor,
+        'previous': thread.page.previous_cursor})
+
+
+@login_required
+@require_POST
+def add_article_comment(request, slug):
+    article = get_object_or_404(Article.objects.only('slug'), slug=slug)
+    form = ArticleCommentForm(request.POST)
+    if form.is_valid():
+        comment = form.save(commit=False)
+        comment.article = article
+        comment.author = request.profile
+        comment.save()
+    return redirect('article-get', slug=article.slug)
+
+
+@login_required
+@require_POST
+def vote_comment(request, pk):
+    delta = -1 if request.POST.get('vote') == 'down' else 1
+    ranking = vote(pk, delta)
+    if ranking is None:
+        return JsonResponse({'error': 'No such comment'}, status=404)
+    return JsonResponse({'pk': int(pk), 'ranking': ranking})
+
+
 def add_article(request):
     user = request.user
     if user.is_authenticated and request.method == 'POST':
         form = ArticleCreationForm(request.POST)
         if form.is_valid():
             article = form.save(commit=False)
-            custom_user = CustomUser.objects.get(user=user)
-            blog = Blog.objects.get_or_create(author=custom_user)[0]
+            blog = Blog.objects.get_or_create(author=request.profile)[0]
             article.blog = blog
+            # Fanned out by the save once the article is published.
             article.save()
-            subscribers = blog.subscribers.all()
-            articles2read = []
-            for sub in subscribers:
-                if not ArticleList.objects.filter(user=sub,
-                                                  article=article).exists():
-                    articles2read.append({'article': article, 'user': sub})
-            ArticleList.objects.bulk_create([ArticleList(**kw) for kw
-                                             in articles2read])
             return get_article(request, slug=article.slug)
     else:
         form = ArticleCreationForm()
@@ -92,6 +148,8 @@ def update_article(request, pk):
         form = ArticleUpdatingForm(request.POST, instance=obj)
         if form.is_valid():
             article = form.save()
+            if article.is_published():
+                render_article_feeds.delay(article.pk)
             return get_article(request, slug=article.slug)
     else:
         form = ArticleUpdatingForm(instance=obj)
@@ -101,59 +159,51 @@ def update_article(request, pk):
 
 
 def get_subscribed_articles(request):
-    user = CustomUser.objects.get(user=request.user)
-    objects = ArticleList.objects.filter(user=user.pk)\
-        .order_by('article__published_date')
-    if objects.count() < 1:
-        blogs = [blog.pk for blog in Blog.objects.filter(subscribers=user)]
-        articles = Article.objects.filter(published=True, blog__in=blogs)\
-            .order_by('published_date')
-        new_objects = [{'article': article, 'user': user} for article
-                       in articles]
-        ArticleList.objects.bulk_create([ArticleList(**kw) for kw
-                                         in new_objects])
-        if ArticleList.objects.filter(user=user.pk).exists():
-            objects = ArticleList.objects.filter(user=user.pk)\
-                .order_by('article__published_date')
-    context = {'objects': objects}
+    page = paginate(request,
+                    TimelineEntry.objects.filter(user=request.profile))
+    context = {'objects': page.object_list, 'page': page}
     return render(request, 'articles.html', context)
 
 
 def control_subscription(request):
     context = {'title': "Subscription control"}
-    user = CustomUser.objects.get(user=request.user)
-    blogs = Blog.objects.filter(deleted=False)
-    objects = []
-    for blog in blogs:
-        subscribers = blog.subscribers.all()
-        subscribed = True if user in subscribers else False
-        objects.append({'blog_name': blog.name, 'subscribe': subscribed,
-                        'author_name': blog.author.user.get_username()})
+    user = request.profile
+    blogs = list(Blog.objects.filter(deleted=False)
+                 .select_related('author__user').order_by('name'))
+    blogs_by_name = dict((blog.name, blog) for blog in blogs)
+    subscribed = set(user.blog_set.values_list('pk', flat=True))
+    objects = [{'blog_name': blog.name, 'subscribe': blog.pk in subscribed,
+                'author_name': blog.author.user.get_username()}
+               for blog in blogs]
     BlogFormset = formset_factory(BlogSubscribeForm, extra=0)
     if request.method == 'POST':
-        articles2read = []
         formset = BlogFormset(request.POST, request.FILES)
         if formset.is_valid():
-            for data in formset.cleaned_data:
-                new_blog = blogs.filter(name=data.get('blog_name'))[0]
-                if data.get('subscribe'):
-                    new_blog.subscribers.add(user)
-                    articles = new_blog.article_set.all()
-                    for article in articles:
-                        if not ArticleList.objects\
-                                .filter(user=user, article=article).exists():
-                            articles2read.append({'article': article,
-                                                  'user': user})
-                else:
-                    old_subscribers = new_blog.subscribers.all()
-                    if user in old_subscribers:
-                        new_blog.subscribers.remove(user)
-                        for article in new_blog.article_set.all():
-                            ArticleList.objects\
-                                .filter(user=user, article=article).delete()
-            if articles2read:
-                ArticleList.objects.bulk_create([ArticleList(**kw)
-                                                 for kw in articles2read])
+            chosen = [(blogs_by_name[data['blog_name']], data.get('subscribe'))
+                      for data in formset.cleaned_data
+                      if data.get('blog_name') in blogs_by_name]
+            to_add = [blog for blog, subscribe in chosen
+                      if subscribe and blog.pk not in subscribed]
+            to_remove = [blog for blog, subscribe in chosen
+                         if not subscribe and blog.pk in subscribed]
+            if to_add:
+                user.blog_set.add(*to_add)
+                for blog in to_add:
+                    fan_out_subscription.delay(blog.pk, user.pk)
+            if to_remove:
+                with transaction.atomic():
+                    user.blog_set.remove(*to_remove)
+                    dropped = ArticleList.objects.filter(
+                        user=user, article_id__in=Article.objects
+                        .filter(blog__in=to_remove).values('pk'))
+                    # Locked, so no receipt marks one read between the
+                    # count and the delete.
+                    unread = list(counted(dropped.select_for_update())
+                                  .values_list('pk', flat=True))
+                    add_unread({user.pk: -len(unread)})
+                    dropped.delete()
+                    TimelineEntry.objects.filter(
+                        user=user, article__blog__in=to_remove).delete()
             context.update({'success': "You subscriptions were successfully "
                                        "changed"})
     else:
@@ -162,6 +212,33 @@ def control_subscription(request):
     return render(request, 'blogs.html', context)
 
 
+def search_articles(request):
+    query = request.GET.get('q', '')
+    filters = {}
+    for name in ('category', 'blog'):
+        value = request.GET.get(name, '')
+        if value.isdigit():
+            filters[name] = int(value)
+    page = search(query, after=request.GET.get('after'), **filters)
+    params = request.GET.copy()
+    params.pop('after', None)
+    if page.has_next:
+        params['after'] = page.next_cursor
+    context = {'title': "Search", 'query': query, 'objects': page.object_list,
+               'page': page, 'next_query': params.urlencode()}
+    return render(request, 'search.html', context)
+
+
+@staff_member_required
+def cache_stats(request):
+    return JsonResponse({'article': article_cache.stats()})
+
+
+@staff_member_required
+def performance_stats_view(request):
+    return JsonResponse(performance_stats.as_dict())
+
+
 class CustomUserCreateView(CreateView):
     allowed_for_superuser = True
     model = CustomUser
@@ -1,4 +1,5 @@
 ps auxww | grep 'celery worker' | awk '{print $2}' | xargs sudo kill -9
 sudo -u mongodb mongod --shutdown --dbpath /var/lib/mongodb/
 sudo -u mongodb mongod --fork --dbpath /var/lib/mongodb/ --logpath /var/log/mongodb/mongod.log &
-sudo -u celery celery worker -A tryit -l WARNING -f /var/log/celery/celery.log &
+sudo -u celery celery worker -A tryit -Q celery -l WARNING -f /var/log/celery/celery.log &
+sudo -u celery env CELERYD_PREFETCH_MULTIPLIER=0 celery worker -A tryit -Q receipts -c 1 -l WARNING -f /var/log/celery/receipts.log &
@@ -1,10 +1,11 @@
 from __future__ import absolute_import
 
 import os
-import gzip
 from celery import Celery
-from django.core.mail import EmailMessage, get_connection
+from celery.signals import worker_process_shutdown
+from django.core.mail import get_connection
 from django.conf import settings
+from tryit.logs import GzipLogWriter
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tryit.settings')
 
@@ -20,24 +21,94 @@ app.config_from_object('django.conf:settings')
 app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
 
 
+_connection = None
+
+
+def worker_connection():
+    """
+    Returns the mail connection shared by every task of this worker process,
+    opening it on first use.
+    """
+    global _connection
+    if _connection is None:
+        _connection = get_connection()
+        _connection.open()
+    return _connection
+
+
+def reset_worker_connection(**kwargs):
+    global _connection
+    if _connection is not None:
+        try:
+            _connection.close()
+        except Exception:
+            pass
+        _connection = None
+
+
+worker_process_shutdown.connect(reset_worker_connection)
+
+
 # @app.task(queue="mails")
 @app.task
-def send_mail(subject, message, from_addr, user_list, kwargs={}):
-    for user in user_list:
-        mail = EmailMessage(subject, message, from_email=from_addr, to=[from_addr, user.email],
-                            connection=get_connection(), **kwargs)
-        mail.send()
-    return True
+def send_mail(subject, message, from_addr, recipients, kwargs={},
+              interval=None, retries=0, template=None, context=None):
+    """
+    Sends the message to every recipient. Given a MailTemplate slug as
+    ``template``, subject and message are instead rendered from it for each
+    recipient with ``context``.
+    """
+    # blog.models imports this module, so the engine is imported lazily.
+    from blog.mailing import MailDelivery
+    from blog.mailtemplates import mail_templates
+    delivery = MailDelivery(subject, message, from_addr, interval=interval,
+                            retries=retries, message_kwargs=kwargs,
+                            template=template and mail_templates.get(template),
+                            context=context)
+    return delivery.deliver(recipients)._asdict()
+
+
+_log_writers = {}
+
+
+def log_writer(file_name):
+    """
+    Returns the log writer of this worker process for the file. Every
+    process appends to its own ``<file_name>.<pid>.gz``.
+    """
+    key = (file_name, os.getpid())
+    if key not in _log_writers:
+        _log_writers[key] = GzipLogWriter(
+            settings.SAVE_LOGS_DIR, '%s.%d' % key,
+            max_bytes=getattr(settings, 'SAVE_LOGS_MAX_BYTES',
+                              64 * 1024 * 1024),
+            max_age=getattr(settings, 'SAVE_LOGS_MAX_AGE', 24 * 60 * 60),
+            batch_size=getattr(settings, 'SAVE_LOGS_BATCH_SIZE', 1000),
+            flush_interval=getattr(settings, 'SAVE_LOGS_FLUSH_INTERVAL', 60))
+    return _log_writers[key]
+
+
+def flush_logs(**kwargs):
+    for (file_name, pid), writer in list(_log_writers.items()):
+        if pid == os.getpid():
+            writer.flush()
+
+
+worker_process_shutdown.connect(flush_logs)
 
 
 @app.task
 def add_log(content, file_name):
-    path = os.path.join(settings.SAVE_LOGS_DIR)
-    if not os.path.exists(path):
-        os.mkdir(path)
-    name = os.path.join(path, file_name)
-    with gzip.open(name, 'wb') as f:
-        f.write(content)
+    """
+    Appends a record, or a list of records, to the compressed log. Records
+    reach the disk when a batch fills up, after the flush interval or when
+    the worker shuts down.
+    """
+    writer = log_writer(file_name)
+    if isinstance(content, (list, tuple)):
+        writer.write_many(content)
+    else:
+        writer.write(content)
     return True
 
 
@@ -0,0 +1,132 @@
+import atexit
+import gzip
+import os
+import struct
+import threading
+import time
+
+FRAME_HEADER = struct.Struct('>I')
+# Magic, method and flags, then the modification time of the gzip member.
+GZIP_HEADER = struct.Struct('<4xI')
+
+
+def created_at(path):
+    """
+    When a log file was started: the time stamped in the header of its
+    first gzip member, written with the first batch.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(GZIP_HEADER.size)
+    if len(header) < GZIP_HEADER.size:
+        return time.time()
+    return GZIP_HEADER.unpack(header)[0]
+
+
+def _to_bytes(record):
+    if isinstance(record, bytes):
+        return record
+    return record.encode('utf-8')
+
+
+class GzipLogWriter(object):
+    """
+    Appends length-framed records to ``<directory>/<name>.gz``.
+
+    Records are buffered and every flush appends them as one more gzip
+    member, so the compressor is set up once per batch rather than once per
+    record, and nothing written before is rewritten. A batch is flushed
+    once it holds ``batch_size`` records, by a timer ``flush_interval``
+    seconds after its first record, and at exit. The file is rotated to
+    ``<name>.<timestamp>.gz`` once it grows past ``max_bytes`` or gets
+    older than ``max_age`` seconds; its age is read from the file, so it
+    survives restarts of the process.
+
+    Appends and rotations are not coordinated between processes, so every
+    process needs its own file; a copy of the writer inherited through
+    fork drops the buffer of its parent instead of writing it again.
+    """
+
+    def __init__(self, directory, name, max_bytes=64 * 1024 * 1024,
+                 max_age=24 * 60 * 60, batch_size=1000, flush_interval=60,
+                 compresslevel=6):
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compresslevel = compresslevel
+        self._buffer = []
+        self._timer = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        atexit.register(self.close)
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, self.name + '.gz')
+
+    @property
+    def pending(self):
+        return len(self._buffer)
+
+    def write(self, record):
+        with self._lock:
+            self._buffer.append(_to_bytes(record))
+            full = len(self._buffer) >= self.batch_size
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval,
+                                              self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        with self._lock:
+            records, self._buffer = self._buffer, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not records or os.getpid() != self._pid:
+                return
+            self._rotate_if_needed()
+            with gzip.open(self.path, 'ab', self.compresslevel) as f:
+                for record in records:
+                    f.write(FRAME_HEADER.pack(len(record)))
+                    f.write(record)
+
+    def _rotate_if_needed(self):
+        if not os.path.exists(self.path):
+            return
+        too_big = os.path.getsize(self.path) >= self.max_bytes
+        too_old = time.time() - created_at(self.path) >= self.max_age
+        if too_big or too_old:
+            rotated = os.path.join(self.directory, '%s.%s.gz' % (
+                self.name, time.strftime('%Y%m%d%H%M%S')))
+            suffix = 0
+            while os.path.exists(rotated):
+                suffix += 1
+                rotated = os.path.join(self.directory, '%s.%s-%d.gz' % (
+                    self.name, time.strftime('%Y%m%d%H%M%S'), suffix))
+            os.rename(self.path, rotated)
+
+    def close(self):
+        self.flush()
+
+
+def read_records(path):
+    """Yields the records of a log file one at a time."""
+    with gzip.open(path, 'rb') as f:
+        while True:
+            header = f.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            size, = FRAME_HEADER.unpack(header)
+            yield f.read(size)
@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -11,6 +12,92 @@ EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 SAVE_LOGS_DIR = os.path.join(BASE_DIR, 'logs/')
+# Logs are appended in batches of records, at least every flush interval
+# (seconds), to one file per worker process, and rotated by size or age.
+SAVE_LOGS_BATCH_SIZE = 1000
+SAVE_LOGS_FLUSH_INTERVAL = 60
+SAVE_LOGS_MAX_BYTES = 64 * 1024 * 1024
+SAVE_LOGS_MAX_AGE = 24 * 60 * 60
+
+# Number of ArticleList rows inserted per bulk_create batch on fan-out.
+BLOG_FANOUT_CHUNK_SIZE = 1000
+
+# Notification mails sent over one SMTP session before the Mail rows of the
+# batch are updated, and the base delay in seconds between retries.
+BLOG_MAIL_BATCH_SIZE = 100
+BLOG_MAIL_RETRY_BACKOFF = 1.0
+
+# Publish notifications claimed per outbox batch, seconds after which an
+# unfinished claim is taken over, and claims before a notification fails.
+BLOG_OUTBOX = {
+    'batch_size': 20,
+    'lease': 600,
+    'max_attempts': 5,
+}
+
+# Recipients of a publish notification mailed by one chunk task, and
+# seconds without a renewed claim after which a chunk still being sent is
+# taken over; the claim is renewed after every mail batch.
+BLOG_NOTIFICATION_CHUNK_SIZE = 500
+BLOG_NOTIFICATION_CHUNK_LEASE = 600
+
+# Seconds between the digests of users without a preference; 0 mails them
+# every article as it is published.
+BLOG_DIGEST_WINDOW = 0
+
+# Seconds a CustomUser stays cached for request.profile. Saving the
+# profile, its user or its avatar drops it sooner.
+BLOG_PROFILE_CACHE_TIMEOUT = 15 * 60
+
+# Best ranked comments shown above the newest first comment pages.
+BLOG_COMMENTS_TOP = 5
+
+# Articles holding the rarest term of a search query that are ranked. It
+# bounds the work of a query; keep it under SQLite's 999 parameters.
+BLOG_SEARCH_CANDIDATES = 500
+
+# Rows per page of the keyset paginated article listings.
+BLOG_PAGE_SIZE = 20
+
+# Storage of rendered article bodies. 'blog.cache.FileBackend' takes a
+# 'location' option and is shared between the processes of a host.
+BLOG_ARTICLE_CACHE = {
+    'BACKEND': 'blog.cache.LocMemBackend',
+    'OPTIONS': {'max_entries': 1000},
+}
+
+# Article views queue read receipts as messages on the receipts queue; a
+# worker writes them batch_size rows per UPDATE, at least every
+# flush_interval seconds. The messages stay unacknowledged until their
+# batch is written, so the receipts worker must prefetch a whole batch:
+# start it with CELERYD_PREFETCH_MULTIPLIER=0 (see restart.sh).
+BLOG_READ_RECEIPTS = {
+    'flush_interval': 30,
+    'batch_size': 500,
+}
+
+# Share of requests (0..1) whose timings and SQL are recorded by
+# PerformanceMiddleware, and whether those get a Server-Timing header.
+BLOG_PERFORMANCE = {
+    'sample_rate': 0.01,
+    'server_timing': False,
+}
+
+# Host the pre-rendered syndication feeds link to, and seconds a rendered
+# feed is served before it is rendered again even if no article changed.
+BLOG_FEED_HOST = '127.0.0.1'
+BLOG_FEED_CACHE_TIMEOUT = 10 * 60
+
+# Must be shared by every web and Celery process: feeds are rendered by
+# the workers and served by the web processes, and entries invalidated by
+# one process are read by the others. Override in local_settings.py.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.environ.get('BLOG_MEMCACHED', '127.0.0.1:11211'),
+        'KEY_PREFIX': 'tryit',
+    },
+}
 
 ALLOWED_HOSTS = []
 
@@ -25,11 +112,13 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'blog.middleware.PerformanceMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
+    'blog.middleware.ProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -48,6 +137,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'blog.context_processors.unread_count',
             ],
         },
     },
@@ -80,13 +170,17 @@ USE_TZ = True
 STATIC_ROOT = os.path.join(BASE_DIR, 'statics')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 AVATAR_DIR = 'avatar'
+AVATAR_THUMBNAIL_SIZE = 64
 
 STATIC_URL = '/static/'
 # Additional locations of static files
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "static"),
-    '/var/www/static/',
 ]
+# collectstatic writes content-hashed copies listed in a manifest, with .gz
+# (and .br when the brotli package is installed) siblings of text files.
+STATICFILES_STORAGE = 'blog.storage.CompressedManifestStaticFilesStorage'
+STATIC_BROTLI = True
 
 STATICFILES_FINDERS = (
     'django.contrib.staticfiles.finders.FileSystemFinder',
@@ -103,6 +197,26 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Europe/Moscow'
 CELERY_ENABLE_UTC = True
+# 0 lifts the limit; used by the receipts worker.
+CELERYD_PREFETCH_MULTIPLIER = int(
+    os.environ.get('CELERYD_PREFETCH_MULTIPLIER', 4))
+CELERY_ROUTES = {
+    'blog.tasks.write_read_receipts': {'queue': 'receipts'},
+}
+
+# Picks up notifications whose post-commit task was lost, queues again the
+# chunks that failed or whose worker died, and mails the hourly and daily
+# digests.
+CELERYBEAT_SCHEDULE = {
+    'drain-outbox': {
+        'task': 'blog.tasks.drain_outbox',
+        'schedule': timedelta(minutes=1),
+    },
+    'send-digests': {
+        'task': 'blog.tasks.send_digests',
+        'schedule': timedelta(minutes=5),
+    },
+}
 
 CELERY_RESULT_BACKEND = "mongodb"
 CELERY_MONGODB_BACKEND_SETTINGS = {
@@ -0,0 +1,10 @@
+from tryit.settings import *
+
+# The test runner is a single process: no shared cache is needed, and the
+# tasks queued by the views under test stay in process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+BROKER_URL = 'memory://'
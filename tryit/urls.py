@@ -1,8 +1,13 @@
+from django.conf import settings
 from django.conf.urls import include, url
 from django.contrib import admin
 from blog import urls as blog_urls
+from blog.assets import serve_static
 
 urlpatterns = [
     url(r'^', include(blog_urls)),
     url(r'^admin/', include(admin.site.urls)),
+    # runserver serves /static/ itself; behind WSGI collected files are
+    # served from STATIC_ROOT with their cache and encoding headers.
+    url(r'^%s(?P<path>.+)$' % settings.STATIC_URL.lstrip('/'), serve_static),
 ]
\ No newline at end of file